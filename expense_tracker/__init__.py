@@ -0,0 +1,4 @@
+# Headless core of the Personal Expense Tracker: storage backends, the ledger, imports,
+# autopay and reports, usable without Streamlit (see cli.py for the command line).
+# Nothing is imported here so `python -m expense_tracker` starts fast; import the
+# submodules you need, e.g. `from expense_tracker import storage`.
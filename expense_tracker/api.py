@@ -0,0 +1,386 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from . import autopay_schedule, core, paging, storage, tenants
+
+# HTTP/JSON API (a plain ASGI app, run it with any ASGI server):
+#   python -m expense_tracker.api --port 8000        (needs `pip install uvicorn`)
+#
+# The app keeps one backend (one per tenant in multi-user mode) for the life of the
+# process, so every request is served from the same warm caches: the ledger, rollups,
+# indexes and sorted page views are built once, not per request. Storage calls block, so
+# they run on a fixed pool of WORKERS threads; SQLite keeps one connection per thread,
+# which makes the pool a connection pool too.
+#
+#   GET  /transactions    one page: sort, desc, after, before, limit, start, end,
+#                         category, transaction, month (cursors are JSON, from next/prev)
+#   POST /transactions    {"date", "transaction", "category", "description", "amount"}, or a
+#                         list of them, which is posted as one batch
+#   GET  /loans           one page, like /transactions
+#   POST /loans           {"date", "kind": "Loan"|"Debt", "to", "description", "amount"}
+#   POST /loans/settle    {"ids": [...], "amounts": [...] (optional, partial payments)}
+#   GET  /positions       what every counterparty owes / is owed
+#   GET  /autopay         one page, like /transactions
+#   POST /autopay         {"start_date", "description", "amount", "frequency", "category"}
+#   POST /autopay/run     {"date"} (optional, default today)
+#   GET  /report          balance and totals
+#   GET  /balance         current balance, or at the end of ?as_of=YYYY-MM-DD
+#
+# In multi-user mode (EXPENSE_TRACKER_USERS=on) requests log in with HTTP Basic auth and
+# only see their own tenant.
+
+WORKERS = int(os.environ.get("EXPENSE_TRACKER_API_WORKERS", "4"))
+MAX_BODY = 64 * 1024 * 1024
+MAX_LIMIT = 1000
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_value(value):
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return storage.date_str(value)
+    return storage._json_value(value)
+
+
+def _rows(df):
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in storage._records(df, dict(zip(columns, columns)))]
+
+
+def _page(page):
+    return {"rows": _rows(page.rows), "next": page.next, "prev": page.prev}
+
+
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _date(value, name):
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a YYYY-MM-DD date, got {value!r}") from None
+
+
+def _amount(value, name="amount"):
+    if isinstance(value, bool):
+        raise HTTPError(400, f"{name} must be a number, got {value!r}")
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be a number, got {value!r}") from None
+    if not math.isfinite(amount) or amount <= 0:
+        raise HTTPError(400, f"{name} must be a positive number, got {value!r}")
+    return amount
+
+
+#an optional text field of a JSON body, `default` when it is missing, null or empty
+def _text(body, name, default=""):
+    value = body.get(name)
+    if value is None or value == "":
+        return default
+    if not isinstance(value, str):
+        raise HTTPError(400, f"{name} must be a string, got {value!r}")
+    return value
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+#a cursor is [sort key, row ID], the key a number for number columns (NaN for missing
+#ones), a YYYY-MM-DD date or "" for date columns and a string otherwise
+def _cursor(value, name, sort):
+    if value is None:
+        return None
+    try:
+        cursor = json.loads(value)
+    except ValueError:
+        cursor = None
+    if not isinstance(cursor, list) or len(cursor) != 2 or not _is_int(cursor[1]):
+        cursor = None
+    elif sort in paging.NUMBER_COLUMNS:
+        if not (_is_int(cursor[0]) or isinstance(cursor[0], float)):
+            cursor = None
+    elif not isinstance(cursor[0], str):
+        cursor = None
+    elif sort in paging.DATE_COLUMNS and cursor[0]:
+        try:
+            datetime.date.fromisoformat(cursor[0])
+        except ValueError:
+            cursor = None
+    if cursor is None:
+        raise HTTPError(400, f"{name} must be a cursor from a previous page's next/prev")
+    return cursor[0], cursor[1]
+
+
+#page arguments shared by the list endpoints
+def _page_args(query, columns):
+    sort = _one(query, "sort", "ID")
+    if sort not in columns:
+        raise HTTPError(400, f"sort must be one of {columns}")
+    try:
+        limit = int(_one(query, "limit", paging.PAGE_SIZE))
+    except ValueError:
+        raise HTTPError(400, "limit must be a number") from None
+    return dict(sort=sort, descending=_one(query, "desc", "false").lower() in ("1", "true", "yes"),
+                after=_cursor(_one(query, "after"), "after", sort),
+                before=_cursor(_one(query, "before"), "before", sort),
+                limit=max(1, min(limit, MAX_LIMIT)))
+
+
+def list_transactions(backend, query, body):
+    month = _one(query, "month")
+    start, end = _one(query, "start"), _one(query, "end")
+    return _page(backend.page("expenses", **_page_args(query, storage.EXPENSE_COLUMNS),
+                              start=_date(start, "start") if start else None,
+                              end=_date(end, "end") if end else None,
+                              categories=query.get("category"), transactions=query.get("transaction"),
+                              month=int(month) if month else None))
+
+
+def add_transactions(backend, query, body):
+    entries = body if isinstance(body, list) else [body]
+    rows = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise HTTPError(400, "expected a transaction object or a list of them")
+        transaction = entry.get("transaction", "Expenditure")
+        if transaction not in ("Income", "Expenditure"):
+            raise HTTPError(400, "transaction must be Income or Expenditure")
+        rows.append((_date(entry.get("date", datetime.date.today().isoformat()), "date"), transaction,
+                     _text(entry, "category", "Miscellaneous" if transaction == "Expenditure" else ""),
+                     _text(entry, "description"), _amount(entry.get("amount"))))
+    if not rows:
+        raise HTTPError(400, "no transactions given")
+    if len(rows) == 1:
+        balance = backend.post(rows)
+    else:
+        #one vectorized post and one write for the whole list
+        balance = backend.post_frame(pd.DataFrame(rows, columns=["Date", "Transaction", "Category",
+                                                                 "Description", "Amount"]))
+    return {"count": len(rows), "balance": balance}
+
+
+def list_loans(backend, query, body):
+    return _page(backend.page("loans", **_page_args(query, storage.LOAN_COLUMNS)))
+
+
+def add_loan(backend, query, body):
+    kind = body.get("kind")
+    if kind not in ("Loan", "Debt"):
+        raise HTTPError(400, "kind must be Loan or Debt")
+    to = body.get("to")
+    if to is not None and not isinstance(to, str):
+        raise HTTPError(400, f"to must be a string, got {to!r}")
+    to = (to or "").strip()
+    if not to:
+        raise HTTPError(400, "to is required")
+    description = _text(body, "description", f"Loan given to {to}" if kind == "Loan" else f"Indebted to {to}")
+    row_id = backend.register_loan(_date(body.get("date", datetime.date.today().isoformat()), "date"),
+                                   kind, to, description, _amount(body.get("amount")))
+    return {"id": row_id}
+
+
+def settle_loans(backend, query, body):
+    ids = body.get("ids")
+    if not isinstance(ids, list) or not ids or not all(_is_int(i) for i in ids):
+        raise HTTPError(400, "ids must be a list of loan IDs")
+    amounts = body.get("amounts")
+    if amounts is not None:
+        if not isinstance(amounts, list) or len(amounts) != len(ids):
+            raise HTTPError(400, "amounts must be a list as long as ids")
+        amounts = [_amount(a, "amounts") for a in amounts]
+    paid, skipped = core.settle_up(backend, ids, amounts)
+    return {"paid": paid, "skipped": skipped}
+
+
+def positions(backend, query, body):
+    book = backend.positions()
+    return {"owed_to_me": book.total_owed_to_me(), "owed_by_me": book.total_owed_by_me(),
+            "people": _rows(book.table())}
+
+
+def list_autopay(backend, query, body):
+    return _page(backend.page("autopay", **_page_args(query, storage.AUTOPAY_COLUMNS)))
+
+
+def add_autopay(backend, query, body):
+    frequency = body.get("frequency", "Monthly")
+    if frequency not in autopay_schedule.DAY_STEPS and frequency not in autopay_schedule.MONTH_STEPS:
+        raise HTTPError(400, "frequency must be Daily, Weekly, Monthly or Yearly")
+    start = storage.date_str(_date(body.get("start_date", datetime.date.today().isoformat()), "start_date"))
+    row = pd.DataFrame([[None, start, "Expenditure", _text(body, "category", "AutoPay"),
+                         _text(body, "description", "AutoPay"), _amount(body.get("amount")), frequency, start]],
+                       columns=storage.AUTOPAY_COLUMNS)
+    autopay, version = backend.checkout("autopay")
+    saved = backend.save_autopay(pd.concat([autopay, row], ignore_index=True) if len(autopay) else row,
+                                 (autopay, version))
+    return {"id": int(saved["ID"].iloc[-1])}
+
+
+def run_autopay(backend, query, body):
+    today = _date(body["date"], "date") if body.get("date") else None
+    return {"payments": core.run_autopay(backend, today)}
+
+
+def report(backend, query, body):
+    return core.report(backend)
+
+
+def balance(backend, query, body):
+    as_of = _one(query, "as_of")
+    if as_of:
+        return {"as_of": as_of, "balance": float(backend.balance_as_of(_date(as_of, "as_of")))}
+    return {"balance": float(backend.load_balance())}
+
+
+ROUTES = {
+    ("GET", "/transactions"): list_transactions, ("POST", "/transactions"): add_transactions,
+    ("GET", "/loans"): list_loans, ("POST", "/loans"): add_loan, ("POST", "/loans/settle"): settle_loans,
+    ("GET", "/positions"): positions,
+    ("GET", "/autopay"): list_autopay, ("POST", "/autopay"): add_autopay, ("POST", "/autopay/run"): run_autopay,
+    ("GET", "/report"): report, ("GET", "/balance"): balance,
+}
+
+
+class API:
+
+    def __init__(self, backend=None, registry=None, workers=WORKERS):
+        self._backend = backend
+        self.registry = registry
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        #sha256 of an accepted Authorization header -> tenant, so the password hash
+        #isn't recomputed on every request
+        self._logins = {}
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="expense-api")
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    #the backend a request works on, blocking (run on the pool)
+    def backend(self, headers):
+        if self.registry is None and not tenants.enabled():
+            if self._backend is None:
+                self._backend = storage.get_backend()
+            return self._backend
+        registry = self.registry = self.registry or tenants.get_tenants()
+        header = headers.get(b"authorization", b"")
+        key = hashlib.sha256(header).hexdigest()
+        tenant = self._logins.get(key)
+        if tenant is None:
+            scheme, _, credentials = header.partition(b" ")
+            try:
+                username, _, password = base64.b64decode(credentials).decode("utf-8").partition(":")
+            except ValueError:
+                username = password = None
+            if scheme.lower() != b"basic" or not username:
+                raise HTTPError(401, "log in with HTTP Basic auth")
+            tenant = registry.users.authenticate(username, password)
+            if tenant is None:
+                raise HTTPError(401, "wrong username or password")
+            self._logins[key] = tenant
+        return registry.backend(tenant)
+
+    def handle(self, handler, headers, query, body):
+        return handler(self.backend(headers), query, body)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    self.close()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        try:
+            status, result = 200, await self._respond(scope, receive)
+        except HTTPError as e:
+            status, result = e.status, {"error": str(e)}
+        except (ValueError, KeyError) as e:
+            status, result = 400, {"error": str(e)}
+        payload = json.dumps(result, default=_json_value).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        if status == 401:
+            headers.append((b"www-authenticate", b'Basic realm="expense tracker"'))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _respond(self, scope, receive):
+        path = scope["path"].rstrip("/") or "/"
+        handler = ROUTES.get((scope["method"], path))
+        if handler is None:
+            if any(route_path == path for _, route_path in ROUTES):
+                raise HTTPError(405, f"{scope['method']} is not allowed on {path}")
+            raise HTTPError(404, f"no such endpoint: {path}")
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY:
+                raise HTTPError(413, "request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = {}
+        if size:
+            try:
+                body = json.loads(b"".join(chunks))
+            except ValueError:
+                raise HTTPError(400, "the request body must be JSON") from None
+        if scope["method"] == "POST" and not isinstance(body, (dict, list)):
+            raise HTTPError(400, "the request body must be a JSON object")
+        if isinstance(body, list) and handler is not add_transactions:
+            raise HTTPError(400, "the request body must be a JSON object")
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        headers = dict(scope.get("headers", []))
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool(), self.handle, handler, headers, query, body)
+
+
+app = API()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Expense tracker HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving the API needs an ASGI server: pip install uvicorn "
+                         "(or run expense_tracker.api:app with any other ASGI server)") from None
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Works out every autopay payment that has fallen due, for all rules at once.
+# A rule that is months behind gets one payment per missed occurrence, each dated on the
+# day it was due, and its Next Due moves to the first occurrence after today.
+# Monthly/yearly occurrences are counted from the rule's Next Due like pd.DateOffset
+# does: same day of the month, clipped to the last day of shorter months.
+
+DAY_STEPS = {"Daily": 1, "Weekly": 7}
+MONTH_STEPS = {"Monthly": 1, "Yearly": 12}
+
+
+def _days(value):
+    return value.astype("datetime64[D]")
+
+
+#day `dom` (1-based) of each month, clipped to the month's length
+def _month_day(months, dom):
+    first = _days(months)
+    length = (_days(months + 1) - first).astype("int64")
+    return first + (np.minimum(dom, length) - 1)
+
+
+#Occurrence number k of each rule (k=0 is its current Next Due)
+def _occurrence(next_due, day_step, month_step, k):
+    by_day = next_due + (k * day_step).astype("timedelta64[D]")
+    base_month = next_due.astype("datetime64[M]")
+    dom = (next_due - _days(base_month)).astype("int64") + 1
+    months = base_month + (k * month_step).astype("timedelta64[M]")
+    by_month = _month_day(months, dom)
+    return np.where(day_step > 0, by_day, by_month)
+
+
+#Earliest Next Due of the rules as a date (None without any), rules with an unknown
+#frequency never fall due
+def earliest_due(autopay):
+    due = pd.to_datetime(autopay["Next Due"], errors="coerce")
+    known = autopay["Frequency"].astype(object).isin(set(DAY_STEPS) | set(MONTH_STEPS))
+    due = due[known & due.notna()]
+    return due.min().date() if len(due) else None
+
+
+#Returns (payments, next_due): one payment row per missed occurrence, with the position
+#of its rule in `autopay`, and the new Next Due of every rule as YYYY-MM-DD strings
+def due_payments(autopay, today):
+    n = len(autopay)
+    next_due = _days(pd.to_datetime(autopay["Next Due"], errors="coerce").values)
+    today = np.datetime64(pd.Timestamp(today).date(), "D")
+    frequency = autopay["Frequency"]
+    day_step = frequency.astype(object).map(DAY_STEPS).fillna(0).to_numpy(dtype="int64")
+    month_step = frequency.astype(object).map(MONTH_STEPS).fillna(0).to_numpy(dtype="int64")
+    known = (~np.isnat(next_due)) & ((day_step > 0) | (month_step > 0))
+    due = known & (next_due <= today)
+    safe_due = np.where(due, next_due, today)
+
+    #how many occurrences fall on or before today
+    count = np.zeros(n, dtype="int64")
+    elapsed_days = (today - safe_due).astype("int64")
+    by_day = due & (day_step > 0)
+    count[by_day] = elapsed_days[by_day] // day_step[by_day] + 1
+    by_month = due & (month_step > 0)
+    if by_month.any():
+        elapsed_months = (today.astype("datetime64[M]") - safe_due.astype("datetime64[M]")).astype("int64")
+        k = elapsed_months // np.maximum(month_step, 1)
+        last = _occurrence(safe_due, np.zeros(n, dtype="int64"), month_step, k)
+        k = np.where(last > today, k - 1, k)
+        count[by_month] = k[by_month] + 1
+
+    #expand to one row per occurrence without a python loop over rules
+    rule = np.repeat(np.arange(n), count)
+    starts = np.repeat(np.cumsum(count) - count, count)
+    k = np.arange(len(rule)) - starts
+    dates = _occurrence(safe_due[rule], day_step[rule], month_step[rule], k)
+
+    advanced = _occurrence(safe_due, day_step, month_step, count)
+    new_next = pd.Series(autopay["Next Due"].values, index=autopay.index, dtype=object)
+    new_next[due] = pd.DatetimeIndex(advanced[due]).strftime("%Y-%m-%d")
+
+    payments = pd.DataFrame({
+        "Rule": rule,
+        "Date": pd.DatetimeIndex(dates).strftime("%Y-%m-%d"),
+        "Category": autopay["Category"].values[rule],
+        "Description": autopay["Description"].values[rule],
+        "Amount": pd.to_numeric(autopay["Amount"], errors="coerce").values[rule],
+    })
+    return payments.sort_values(["Date", "Rule"], kind="stable").reset_index(drop=True), new_next
@@ -0,0 +1,213 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import core, ledger, rollups, storage
+
+# Benchmarks for the ledger operations at growing history sizes:
+#   python -m expense_tracker.bench --sizes 1000 100000 1000000 --backends csv sqlite --out bench.json
+#
+# Every (backend, size) gets a fresh temporary folder filled with a synthetic ledger (same
+# seed, same data every run), then each operation is run once under tracemalloc for its peak
+# Python/numpy memory and REPEAT more times for its time. Results are printed as a table and
+# written as JSON together with the commit, so runs of two commits can be compared.
+# 10M rows need a few GB of memory and take minutes per backend.
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+REPEAT = 5
+START = datetime.date(2015, 1, 1)
+#loans settled per run of the settle operation
+SETTLE_BATCH = 100
+CATEGORIES = ["Food and Lifestyle", "Rent", "Groceries", "Internet and Mobile Bills", "Transportation",
+              "Health and Wellness", "Entertainment", "Miscellaneous"]
+PEOPLE = [f"Person {i}" for i in range(200)]
+
+
+# --- Synthetic data ---
+#`rows` expenses spread over ten years, ~10% income, with correct running balances and IDs
+def synthetic_expenses(rows, seed=0, opening=storage.DEFAULT_BALANCE):
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(0, 3650, rows))
+    income = rng.random(rows) < 0.1
+    df = pd.DataFrame({
+        "ID": np.arange(1, rows + 1),
+        "Date": (np.datetime64(START) + days.astype("timedelta64[D]")).astype(str),
+        "Transaction": np.where(income, "Income", "Expenditure"),
+        "Category": np.where(income, "", np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), rows)]),
+        "Description": "synthetic",
+        "Amount": np.round(np.where(income, rng.lognormal(9, 0.5, rows), rng.lognormal(5, 1, rows)), 2),
+    })
+    df["Bank Balance"] = ledger.running_balances(df, opening).values
+    return df
+
+
+def synthetic_loans(rows, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    return pd.DataFrame({
+        "ID": np.arange(1, rows + 1),
+        "Date": (np.datetime64(START) + rng.integers(0, 3650, rows).astype("timedelta64[D]")).astype(str),
+        "Transaction": np.where(rng.random(rows) < 0.5, "Loan", "Debt"),
+        "To": np.array(PEOPLE)[rng.integers(0, len(PEOPLE), rows)],
+        "Description": "synthetic",
+        "Amount": np.round(rng.lognormal(7, 1, rows), 2),
+        "Status": "Unpaid",
+        "Paid": 0.0,
+    })
+
+
+#`rules` autopay rules that last ran `behind` days ago, so the next run has to catch up
+def synthetic_autopay(rules, today, behind=90):
+    due = (today - datetime.timedelta(days=behind)).isoformat()
+    return pd.DataFrame({
+        "ID": np.arange(1, rules + 1),
+        "Start Date": due,
+        "Transaction": "Expenditure",
+        "Category": "AutoPay",
+        "Description": [f"rule {i}" for i in range(rules)],
+        "Amount": 10.0,
+        "Frequency": np.array(["Daily", "Weekly", "Monthly", "Yearly"])[np.arange(rules) % 4],
+        "Next Due": due,
+    })
+
+
+#`repeat` + 1 runs of the settle operation (one untimed for memory) each find open loans
+def fill(backend, rows, seed=0, repeat=REPEAT):
+    backend.save_balance(storage.DEFAULT_BALANCE)
+    backend.save_expenses(synthetic_expenses(rows, seed))
+    backend.save_loans(synthetic_loans(max(SETTLE_BATCH * (repeat + 1), rows // 100), seed))
+    backend.save_autopay(synthetic_autopay(20, datetime.date(2025, 1, 1)))
+
+
+# --- Operations ---
+#name -> function(backend, state) run on a filled backend, in this order (later ones add rows)
+def _load(backend, state):
+    #with the caches dropped this parses the files again
+    backend.drop_caches()
+    return len(backend.load_expenses())
+
+
+def _filter(backend, state):
+    return len(backend.query_expenses(start=datetime.date(2018, 1, 1), end=datetime.date(2019, 12, 31),
+                                      categories=["Groceries", "Rent"]))
+
+
+def _page(backend, state):
+    page = backend.page("expenses", "Date", True, categories=["Groceries"])
+    return len(backend.page("expenses", "Date", True, after=page.next, categories=["Groceries"]))
+
+
+def _aggregate(backend, state):
+    totals = rollups.Rollups.from_frame(backend.load_expenses())
+    return len(totals.category_totals()) + len(totals.monthly_totals()) + len(totals.daily_totals())
+
+
+#the same rollups built from the file chunk by chunk (EXPENSE_TRACKER_AGGREGATION=stream)
+def _aggregate_stream(backend, state):
+    backend.drop_caches()
+    totals = rollups.Rollups.from_chunks(backend.expense_chunks())
+    return len(totals.category_totals()) + len(totals.monthly_totals()) + len(totals.top_expenses())
+
+
+def _add(backend, state):
+    return core.add_expense(backend, datetime.date(2025, 1, 1), "Groceries", "bench", 12.5)
+
+
+def _bulk_add(backend, state):
+    rows = synthetic_expenses(10_000, state["seed"] + state.setdefault("bulk", 0) + 7)
+    state["bulk"] += 1
+    return backend.post_frame(rows.drop(columns=["ID", "Bank Balance"]))
+
+
+def _settle(backend, state):
+    open_ids = backend.loan_book().frame.query("Status != 'Settled'")["ID"]
+    paid, _ = backend.settle_loans(open_ids.iloc[:SETTLE_BATCH])
+    assert paid, "no open loans left to settle"
+    return len(paid)
+
+
+def _autopay(backend, state):
+    backend.save_autopay(synthetic_autopay(20, datetime.date(2025, 1, 1)))
+    return core.run_autopay(backend, datetime.date(2025, 1, 1))
+
+
+OPERATIONS = {"load": _load, "filter": _filter, "page": _page, "aggregate": _aggregate,
+              "aggregate_stream": _aggregate_stream, "add": _add,
+              "bulk_add": _bulk_add, "settle": _settle, "autopay_catch_up": _autopay}
+
+
+def measure(operation, backend, state, repeat=REPEAT):
+    tracemalloc.start()
+    try:
+        operation(backend, state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation(backend, state)
+        times.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": repeat,
+            "peak_mb": peak / 2 ** 20}
+
+
+def run(sizes=DEFAULT_SIZES, kinds=("csv",), operations=tuple(OPERATIONS), repeat=REPEAT, seed=0):
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            folder = tempfile.mkdtemp(prefix=f"expense-bench-{kind}-{size}-")
+            backend = storage.open_backend(kind, folder)
+            try:
+                started = time.perf_counter()
+                fill(backend, size, seed, repeat)
+                setup = time.perf_counter() - started
+                state = {"seed": seed}
+                for name in operations:
+                    result = measure(OPERATIONS[name], backend, state, repeat)
+                    results.append({"backend": kind, "rows": size, "operation": name, **result})
+                    print(f"{kind:8} {size:>10,} {name:17} {result['median_s'] * 1000:10.2f} ms "
+                          f"(min {result['min_s'] * 1000:.2f}) peak {result['peak_mb']:8.1f} MB", flush=True)
+                results.append({"backend": kind, "rows": size, "operation": "setup", "median_s": setup,
+                                "min_s": setup, "runs": 1, "peak_mb": None})
+            finally:
+                backend.close()
+                shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the expense tracker's ledger operations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--backends", nargs="+", default=["csv"], choices=["csv", "sqlite", "parquet", "arrow"])
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    args = parser.parse_args()
+    results = run(args.sizes, args.backends, args.operations, args.repeat, args.seed)
+    report = {"commit": _commit(), "when": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+              "machine": platform.machine(), "results": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Results written to {args.out}")
@@ -0,0 +1,241 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from . import telemetry
+
+# Analytics charts rendered to PNG and memoized.
+# A chart only depends on the rollups it is drawn from, so the PNG is cached under
+# (chart, rollups version, parameters) and served again until the rollups change.
+# The cache is an LRU of at most CACHE_SIZE images, and every figure is cleared right
+# after it is saved, so a long-running server doesn't collect figures or images.
+# Figures are built with matplotlib.figure.Figure rather than pyplot so they are never
+# registered in pyplot's global figure list and sessions can render concurrently.
+#
+# The "interactive" engine instead hands Vega-Lite specs (through Altair) with the
+# pre-aggregated rollup series to the browser, which draws them and handles zoom and pan
+# without a rerun. Long daily series are cut down to MAX_POINTS with LTTB first.
+# EXPENSE_TRACKER_CHARTS=interactive|static picks the default engine.
+
+CACHE_SIZE = 64
+DPI = 100
+MAX_POINTS = 500
+ENGINES = ("static", "interactive")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=DPI, bbox_inches="tight")
+    fig.clear()
+    return buffer.getvalue()
+
+
+def default_engine():
+    engine = os.environ.get("EXPENSE_TRACKER_CHARTS", "static").lower()
+    return engine if engine in ENGINES else "static"
+
+
+#value for `key`, made by `build()` on a cache miss
+def cached(key, build):
+    with _cache_lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+            return value
+    with telemetry.span("chart." + key[0]):
+        value = build()
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+#PNG for `key`, drawn by `draw()` (which returns a Figure) on a cache miss
+def cached_png(key, draw):
+    return cached(key, lambda: _png(draw()))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+# --- Downsampling ---
+#Largest-Triangle-Three-Buckets: keeps the first and last point and, from every bucket in
+#between, the point forming the largest triangle with its neighbours, so peaks survive
+def lttb(x, y, threshold=MAX_POINTS):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(1, n - 1, threshold - 1).astype("int64")
+    keep = np.empty(threshold, dtype="int64")
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        #average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+#Min/max bucketing: the lowest and highest point of each of threshold/2 buckets
+def minmax(y, threshold=MAX_POINTS):
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(0, n, threshold // 2 + 1).astype("int64")
+    keep = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            keep.extend((lo + int(np.argmin(y[lo:hi])), lo + int(np.argmax(y[lo:hi]))))
+    return np.unique(keep)
+
+
+#Daily totals as long rows (Date, Transaction, Amount), each type downsampled on its own
+def daily_points(daily, threshold=MAX_POINTS, method="lttb"):
+    parts = []
+    x = daily.index.values.astype("datetime64[ns]").astype("int64")
+    for transaction in ("Income", "Expenditure"):
+        if transaction not in daily.columns or daily[transaction].sum() <= 0:
+            continue
+        y = daily[transaction].to_numpy(dtype="float64")
+        keep = lttb(x, y, threshold) if method == "lttb" else minmax(y, threshold)
+        parts.append(pd.DataFrame({"Date": daily.index[keep], "Transaction": transaction, "Amount": y[keep]}))
+    if not parts:
+        return pd.DataFrame(columns=["Date", "Transaction", "Amount"])
+    return pd.concat(parts, ignore_index=True)
+
+
+# --- Static (matplotlib) charts ---
+def _draw_pie(series, title):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(series, labels=series.index, autopct='%1.1f%%', startangle=90)
+    ax.axis("equal")
+    ax.set_title(title)
+    return fig
+
+
+def _draw_monthly_line(series):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(series.index.astype(str), series.values, marker="o")
+    ax.set_title("Monthly Expenses")
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Amount (₹)")
+    ax.tick_params(axis="x", labelrotation=45)
+    return fig
+
+
+def _draw_income_vs_expenditure(daily):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    if "Income" in daily.columns and daily["Income"].sum() > 0:
+        ax.plot(daily.index, daily["Income"], label="Income", color="green", marker="o")
+    if "Expenditure" in daily.columns and daily["Expenditure"].sum() > 0:
+        ax.plot(daily.index, daily["Expenditure"], label="Expenditure", color="red", marker="o")
+    ax.set_title("Income vs Expenditure Over Time")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Amount")
+    ax.legend()
+    return fig
+
+
+def _draw_monthly_bar(series):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    ax.bar(series.index.astype(str), series.values, color="red")
+    ax.set_title("Monthly Expenses")
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Total Expenses")
+    ax.tick_params(axis="x", labelrotation=45)
+    return fig
+
+
+def category_pie(totals, transaction="Expenditure"):
+    return cached_png(("category_pie", totals.version, transaction),
+                      lambda: _draw_pie(totals.category_totals(transaction), "Category-wise Expenses"))
+
+
+def monthly_line(totals, transaction="Expenditure"):
+    return cached_png(("monthly_line", totals.version, transaction),
+                      lambda: _draw_monthly_line(totals.monthly_totals(transaction)))
+
+
+def income_vs_expenditure(totals):
+    return cached_png(("income_vs_expenditure", totals.version),
+                      lambda: _draw_income_vs_expenditure(totals.daily_totals()))
+
+
+def monthly_bar(totals, transaction="Expenditure"):
+    return cached_png(("monthly_bar", totals.version, transaction),
+                      lambda: _draw_monthly_bar(totals.monthly_totals(transaction)))
+
+
+# --- Interactive (Vega-Lite) charts ---
+#These return Altair charts, Streamlit hands their spec and data to the browser
+def _monthly_frame(totals, transaction):
+    series = totals.monthly_totals(transaction)
+    return pd.DataFrame({"Month": series.index.astype(str), "Amount": series.values})
+
+
+def interactive_category_pie(totals, transaction="Expenditure"):
+    def build():
+        import altair as alt
+        series = totals.category_totals(transaction)
+        data = pd.DataFrame({"Category": series.index, "Amount": series.values})
+        return alt.Chart(data, title="Category-wise Expenses").mark_arc().encode(
+            theta="Amount:Q", color="Category:N", tooltip=["Category", alt.Tooltip("Amount:Q", format=",.2f")])
+    return cached(("interactive_category_pie", totals.version, transaction), build)
+
+
+def interactive_monthly_line(totals, transaction="Expenditure"):
+    def build():
+        import altair as alt
+        return alt.Chart(_monthly_frame(totals, transaction), title="Monthly Expenses").mark_line(point=True).encode(
+            x=alt.X("Month:O", title="Month"), y=alt.Y("Amount:Q", title="Amount (₹)"),
+            tooltip=["Month", alt.Tooltip("Amount:Q", format=",.2f")])
+    return cached(("interactive_monthly_line", totals.version, transaction), build)
+
+
+def interactive_income_vs_expenditure(totals, threshold=MAX_POINTS, method="lttb"):
+    def build():
+        import altair as alt
+        data = daily_points(totals.daily_totals(), threshold, method)
+        return alt.Chart(data, title="Income vs Expenditure Over Time").mark_line(point=True).encode(
+            x=alt.X("Date:T", title="Date"), y=alt.Y("Amount:Q", title="Amount"),
+            color=alt.Color("Transaction:N", scale=alt.Scale(domain=["Income", "Expenditure"], range=["green", "red"])),
+            tooltip=["Date:T", "Transaction", alt.Tooltip("Amount:Q", format=",.2f")],
+        ).interactive(bind_y=False)
+    return cached(("interactive_income_vs_expenditure", totals.version, threshold, method), build)
+
+
+def interactive_monthly_bar(totals, transaction="Expenditure"):
+    def build():
+        import altair as alt
+        return alt.Chart(_monthly_frame(totals, transaction), title="Monthly Expenses").mark_bar(color="red").encode(
+            x=alt.X("Month:O", title="Month"), y=alt.Y("Amount:Q", title="Total Expenses"),
+            tooltip=["Month", alt.Tooltip("Amount:Q", format=",.2f")])
+    return cached(("interactive_monthly_bar", totals.version, transaction), build)
@@ -0,0 +1,136 @@
+import argparse
+import datetime
+import json
+import math
+import sys
+
+# Command line for batch jobs and cron:
+#   python -m expense_tracker add expense 250 --category Groceries --description "weekly shop"
+#   python -m expense_tracker import statement.csv --dayfirst
+#   python -m expense_tracker report [--json]
+#   python -m expense_tracker run-autopay [--date 2024-05-01]
+#   python -m expense_tracker verify
+# The data is picked like in the app (EXPENSE_TRACKER_BACKEND, EXPENSE_TRACKER_DATA and
+# EXPENSE_TRACKER_DB), --backend / --data / --db override them. Only argparse is imported up
+# front: storage (and with it pandas) is imported by the command that needs it, so --help
+# and argument errors return at once.
+
+
+def _backend(args):
+    from . import storage
+    return storage.configured_backend(args.backend, args.data, args.db)
+
+
+def _date(text):
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {text!r}") from None
+
+
+#amounts must be finite and above zero ("nan", "inf" and "1e400" parse as floats)
+def positive_amount(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {text!r}") from None
+    if not math.isfinite(value) or value <= 0:
+        raise argparse.ArgumentTypeError(f"amount must be a positive number: {text!r}")
+    return value
+
+
+def _add(args):
+    from . import core
+    if args.kind == "expense":
+        balance = core.add_expense(_backend(args), args.date, args.category or "Miscellaneous",
+                                   args.description, args.amount)
+    else:
+        balance = core.add_income(_backend(args), args.date, args.category or "", args.description, args.amount)
+    print(f"Added {args.kind} of {args.amount:.2f}, balance {balance:.2f}")
+
+
+def _import(args):
+    from . import importer
+    count = importer.import_statement(args.statement, _backend(args), args.format, args.chunk_rows, args.dayfirst)
+    print(f"Imported {count} transactions from {args.statement}")
+
+
+def _report(args):
+    from . import core
+    summary = core.report(_backend(args))
+    if args.json:
+        print(json.dumps(summary, indent=1))
+        return
+    print(f"Balance:      {summary['balance']:12.2f}")
+    print(f"Income:       {summary['income']:12.2f}")
+    print(f"Expenditure:  {summary['expenditure']:12.2f}")
+    print(f"Net savings:  {summary['net']:12.2f}")
+    print(f"Owed to you:  {summary['owed_to_me']:12.2f}")
+    print(f"You owe:      {summary['owed_by_me']:12.2f}")
+    for title, values in (("Expenditure by category", summary["by_category"]),
+                          ("Expenditure by month", summary["by_month"])):
+        if values:
+            print(f"\n{title}:")
+            for name, amount in values.items():
+                print(f"  {name:<28}{amount:12.2f}")
+
+
+def _run_autopay(args):
+    from . import core
+    count = core.run_autopay(_backend(args), args.date)
+    print(f"Posted {count} autopay payments")
+
+
+def _verify(args):
+    from . import core
+    drifted = core.verify(_backend(args))
+    if drifted.empty:
+        print("Running balances are consistent")
+        return
+    print(drifted.to_string(index=False))
+    sys.exit(f"error: {len(drifted)} rows have a stored balance that doesn't match their amounts")
+
+
+def parser():
+    main = argparse.ArgumentParser(prog="python -m expense_tracker", description="Personal expense tracker")
+    main.add_argument("--backend", choices=["csv", "sqlite", "parquet", "arrow"],
+                      help="storage backend (default: EXPENSE_TRACKER_BACKEND or csv)")
+    main.add_argument("--data", help="data folder (default: EXPENSE_TRACKER_DATA or .)")
+    main.add_argument("--db", help="SQLite database file (default: EXPENSE_TRACKER_DB or "
+                                   "expenses.db in the data folder)")
+    commands = main.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add an expense or income")
+    add.add_argument("kind", choices=["expense", "income"])
+    add.add_argument("amount", type=positive_amount)
+    add.add_argument("--date", type=_date, default=datetime.date.today())
+    add.add_argument("--category", help="default: Miscellaneous for expenses, none for income")
+    add.add_argument("--description", default="")
+    add.set_defaults(run=_add)
+
+    statement = commands.add_parser("import", help="import a bank statement (csv, ofx, qfx or qif)")
+    statement.add_argument("statement")
+    statement.add_argument("--format", choices=["csv", "ofx", "qfx", "qif"])
+    statement.add_argument("--dayfirst", action="store_true", help="dates are written day first (31/01/2024)")
+    statement.add_argument("--chunk-rows", type=int, default=50_000)
+    statement.set_defaults(run=_import)
+
+    report = commands.add_parser("report", help="balance and totals")
+    report.add_argument("--json", action="store_true")
+    report.set_defaults(run=_report)
+
+    autopay = commands.add_parser("run-autopay", help="post the autopay payments that are due")
+    autopay.add_argument("--date", type=_date, default=None, help="post what is due up to this date (default: today)")
+    autopay.set_defaults(run=_run_autopay)
+
+    verify = commands.add_parser("verify", help="check the stored running balances against the amounts")
+    verify.set_defaults(run=_verify)
+    return main
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    try:
+        args.run(args)
+    except (ValueError, OSError) as e:
+        sys.exit(f"error: {e}")
@@ -0,0 +1,62 @@
+import datetime
+
+from . import ledger
+
+# Ledger operations shared by the Streamlit app and the command line.
+# Everything here works on a storage backend (storage.get_backend() or open_backend()),
+# none of it needs Streamlit or the chart libraries.
+
+
+#Add an expense, returns the new balance
+def add_expense(backend, date, category, description, amount):
+    return backend.post([(date, "Expenditure", category, description, amount)])
+
+
+#Add income, returns the new balance
+def add_income(backend, date, category, description, amount):
+    return backend.post([(date, "Income", category, description, amount)])
+
+
+#Total of the Expenditure rows of an expenses frame
+def calculate_expenses(df):
+    if "Transaction" in df.columns and "Amount" in df.columns:
+        return df[df["Transaction"] == "Expenditure"]["Amount"].sum()
+
+
+#Income minus expenditure of an expenses frame
+def net_expenditure(df):
+    expenditure = df[df["Transaction"] == "Expenditure"]["Amount"].sum()
+    income = df[df["Transaction"] == "Income"]["Amount"].sum()
+    return income - expenditure
+
+
+#Post every autopay payment due up to `today`, returns the number of payments
+def run_autopay(backend, today=None):
+    return backend.run_autopay(today or datetime.date.today())
+
+
+#Pay back loans/debts by ID (in full, or `amounts` of each), returns (paid IDs, skipped IDs)
+def settle_up(backend, ids, amounts=None):
+    return backend.settle_loans(ids, amounts)
+
+
+#Rows whose stored "Bank Balance" disagrees with the balance recomputed from the amounts
+#(a frame, empty when the running balances are consistent)
+def verify(backend):
+    return ledger.drifted_rows(backend.load_expenses(), backend.ledger().opening)
+
+
+#Balance, totals and per-category/per-month expenditure, from the rollups
+def report(backend):
+    totals = backend.rollups()
+    positions = backend.positions()
+    return {
+        "balance": float(backend.load_balance()),
+        "income": float(totals.total("Income")),
+        "expenditure": float(totals.total("Expenditure")),
+        "net": float(totals.net()),
+        "owed_to_me": float(positions.total_owed_to_me()),
+        "owed_by_me": float(positions.total_owed_by_me()),
+        "by_category": {str(k): float(v) for k, v in totals.category_totals("Expenditure").items()},
+        "by_month": {str(k): float(v) for k, v in totals.monthly_totals("Expenditure").items()},
+    }
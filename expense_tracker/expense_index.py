@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Read-only index over the expenses frame for the View Transactions filters.
+# Rows are kept sorted by a datetime64 key so a date range is two binary searches and a
+# slice; Category and Transaction are stored as categorical codes so their filters are
+# integer comparisons on the slice instead of string matching over every row.
+
+
+class ExpenseIndex:
+
+    def __init__(self, df):
+        dates = pd.to_datetime(df["Date"], errors="coerce").values
+        #numpy sorts NaT last, rows without a valid date stay at the end
+        order = np.argsort(dates, kind="stable")
+        self.order = order
+        self.frame = df.iloc[order]
+        self.dates = dates[order]
+        self.valid = int((~np.isnat(self.dates)).sum())
+        self.category = pd.Categorical(df["Category"].values[order])
+        self.transaction = pd.Categorical(df["Transaction"].values[order])
+
+    def __len__(self):
+        return len(self.frame)
+
+    #positions [lo, hi) of the rows dated from `start` to the end of day `end`
+    def date_slice(self, start=None, end=None):
+        if start is None and end is None:
+            return 0, len(self.frame)
+        dated = self.dates[:self.valid]
+        lo = 0
+        hi = self.valid
+        if start is not None:
+            lo = int(np.searchsorted(dated, np.datetime64(pd.Timestamp(start).normalize()), "left"))
+        if end is not None:
+            next_day = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+            hi = int(np.searchsorted(dated, np.datetime64(next_day), "left"))
+        return lo, max(lo, hi)
+
+    #(lo, hi, mask): the rows matching the filters are the ones of [lo, hi) where mask is True
+    def _match(self, start, end, categories, transactions, month):
+        lo, hi = self.date_slice(start, end)
+        mask = np.ones(hi - lo, dtype=bool)
+        if categories:
+            mask &= _code_mask(self.category, lo, hi, categories)
+        if transactions:
+            mask &= _code_mask(self.transaction, lo, hi, transactions)
+        if month is not None:
+            months = self.dates[lo:hi].astype("datetime64[M]").astype("int64") % 12 + 1
+            mask &= ~np.isnat(self.dates[lo:hi]) & (months == month)
+        return lo, hi, mask
+
+    def query(self, start=None, end=None, categories=None, transactions=None, month=None):
+        lo, hi, mask = self._match(start, end, categories, transactions, month)
+        if mask.all():
+            return self.frame.iloc[lo:hi]
+        return self.frame.iloc[lo + np.flatnonzero(mask)]
+
+    #Positions of the matching rows in the frame the index was built from
+    def positions(self, start=None, end=None, categories=None, transactions=None, month=None):
+        lo, hi, mask = self._match(start, end, categories, transactions, month)
+        return self.order[lo + np.flatnonzero(mask)]
+
+    def distinct(self, column):
+        values = {"Category": self.category, "Transaction": self.transaction}[column]
+        return values.categories.tolist()
+
+    def date_bounds(self):
+        if self.valid == 0:
+            return None, None
+        return pd.Timestamp(self.dates[0]).date(), pd.Timestamp(self.dates[self.valid - 1]).date()
+
+
+def _code_mask(values, lo, hi, wanted):
+    codes = values.categories.get_indexer(list(wanted))
+    return np.isin(values.codes[lo:hi], codes[codes >= 0])
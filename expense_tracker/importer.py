@@ -0,0 +1,209 @@
+import argparse
+import io
+import os
+import re
+
+import pandas as pd
+
+from . import storage
+
+# Bulk import of bank statements (CSV, OFX or QIF).
+# Files are read in chunks of CHUNK_ROWS transactions, each chunk is mapped onto the
+# expenses columns and posted with Backend.post_frame(): running balances are computed
+# vectorized and every chunk is one write. Memory stays bounded by the chunk size.
+
+CHUNK_ROWS = 50_000
+DEFAULT_CATEGORY = "Miscellaneous"
+
+#column names banks commonly use, first match wins
+DATE_COLUMNS = ["Date", "Transaction Date", "Posting Date", "Posted Date", "Value Date", "Txn Date"]
+DESCRIPTION_COLUMNS = ["Description", "Narration", "Details", "Payee", "Memo", "Name", "Particulars"]
+AMOUNT_COLUMNS = ["Amount", "Transaction Amount"]
+DEBIT_COLUMNS = ["Debit", "Withdrawal", "Withdrawal Amt.", "Withdrawals", "Debit Amount"]
+CREDIT_COLUMNS = ["Credit", "Deposit", "Deposit Amt.", "Deposits", "Credit Amount"]
+CATEGORY_COLUMNS = ["Category"]
+
+
+def _pick(columns, candidates):
+    lowered = {c.strip().lower(): c for c in columns}
+    for name in candidates:
+        if name.lower() in lowered:
+            return lowered[name.lower()]
+    return None
+
+
+def _number(series):
+    numbers = pd.to_numeric(series, errors="coerce")
+    messy = numbers.isna() & series.notna()
+    if messy.any():
+        #"1,234.50" and "(12.00)" show up in bank exports, only those values get cleaned up
+        text = series[messy].astype(str).str.replace(",", "", regex=False).str.strip()
+        text = text.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+        numbers[messy] = pd.to_numeric(text, errors="coerce")
+    return numbers
+
+
+def _text_lines(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            yield from f
+    elif isinstance(source, io.TextIOBase):
+        yield from source
+    else:
+        yield from io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+
+
+def _statement_frame(records):
+    return pd.DataFrame(records, columns=["Date", "Description", "Amount", "Category"])
+
+
+# --- CSV ---
+#Yields chunks with Date, Description, Amount (signed, income positive) and Category
+def read_csv_statement(source, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, dtype=str, skipinitialspace=True):
+        columns = list(chunk.columns)
+        date_col = _pick(columns, DATE_COLUMNS)
+        if date_col is None:
+            raise ValueError(f"No date column found in statement columns {columns}")
+        amount_col = _pick(columns, AMOUNT_COLUMNS)
+        if amount_col is not None:
+            amount = _number(chunk[amount_col])
+        else:
+            debit_col = _pick(columns, DEBIT_COLUMNS)
+            credit_col = _pick(columns, CREDIT_COLUMNS)
+            if debit_col is None and credit_col is None:
+                raise ValueError(f"No amount, debit or credit column found in {columns}")
+            debit = _number(chunk[debit_col]).fillna(0.0) if debit_col else 0.0
+            credit = _number(chunk[credit_col]).fillna(0.0) if credit_col else 0.0
+            amount = credit - debit
+        description_col = _pick(columns, DESCRIPTION_COLUMNS)
+        category_col = _pick(columns, CATEGORY_COLUMNS)
+        yield pd.DataFrame({
+            "Date": pd.to_datetime(chunk[date_col], errors="coerce", dayfirst=dayfirst),
+            "Description": chunk[description_col] if description_col else "",
+            "Amount": amount,
+            "Category": chunk[category_col] if category_col else None,
+        })
+
+
+# --- OFX (SGML 1.x or XML 2.x) ---
+#Tags are read token by token, so closing tags may be missing and a whole file may be on one line
+def read_ofx_statement(source, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    records = []
+    current = None
+    for line in _text_lines(source):
+        for token in line.split("<")[1:]:
+            tag, _, value = token.partition(">")
+            tag = tag.strip().upper()
+            value = value.strip()
+            if tag == "STMTTRN":
+                current = {}
+            elif tag == "/STMTTRN" and current is not None:
+                records.append((current.get("DTPOSTED", "")[:8], current.get("NAME") or current.get("MEMO", ""),
+                                current.get("TRNAMT"), None))
+                current = None
+                if len(records) >= chunk_rows:
+                    yield _ofx_frame(records)
+                    records = []
+            elif current is not None and not tag.startswith("/") and value:
+                current[tag] = value
+    if records:
+        yield _ofx_frame(records)
+
+
+def _ofx_frame(records):
+    df = _statement_frame(records)
+    df["Date"] = pd.to_datetime(df["Date"], format="%Y%m%d", errors="coerce")
+    df["Amount"] = _number(df["Amount"])
+    return df
+
+
+# --- QIF ---
+QIF_DATE = re.compile(r"['\s]+")
+
+
+def read_qif_statement(source, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    records = []
+    current = {}
+    for line in _text_lines(source):
+        line = line.rstrip("\r\n")
+        if not line or line.startswith("!"):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == "^":
+            if current:
+                records.append((current.get("D"), current.get("P") or current.get("M", ""),
+                                current.get("T") or current.get("U"), current.get("L")))
+            current = {}
+            if len(records) >= chunk_rows:
+                yield _qif_frame(records, dayfirst)
+                records = []
+        elif code in "DTUPML" and code not in current:
+            current[code] = value
+    if current:
+        records.append((current.get("D"), current.get("P") or current.get("M", ""),
+                        current.get("T") or current.get("U"), current.get("L")))
+    if records:
+        yield _qif_frame(records, dayfirst)
+
+
+def _qif_frame(records, dayfirst):
+    df = _statement_frame(records)
+    #Quicken writes dates like 1/31'24 or 1/31/2024
+    dates = df["Date"].fillna("").str.replace(QIF_DATE, "/", regex=True)
+    df["Date"] = pd.to_datetime(dates, errors="coerce", dayfirst=dayfirst, format="mixed")
+    df["Amount"] = _number(df["Amount"])
+    #categories like "Food:Groceries" keep the top level, transfers "[Account]" are dropped
+    df["Category"] = df["Category"].where(~df["Category"].fillna("").str.startswith("["))
+    df["Category"] = df["Category"].str.split(":").str[0]
+    return df
+
+
+READERS = {"csv": read_csv_statement, "ofx": read_ofx_statement, "qfx": read_ofx_statement,
+           "qif": read_qif_statement}
+
+
+def detect_format(name):
+    extension = os.path.splitext(str(name))[1].lower().lstrip(".")
+    if extension not in READERS:
+        raise ValueError(f"Unknown statement format '{extension}', expected one of {sorted(READERS)}")
+    return extension
+
+
+#Map a statement chunk onto the expenses columns (Bank Balance is filled in by post_frame)
+def to_expenses(chunk):
+    chunk = chunk.dropna(subset=["Date", "Amount"])
+    chunk = chunk[chunk["Amount"] != 0]
+    income = chunk["Amount"] > 0
+    category = chunk["Category"].astype(object)
+    category = category.where(category.notna() & (category != ""), None)
+    return pd.DataFrame({
+        "Date": chunk["Date"].dt.strftime("%Y-%m-%d"),
+        "Transaction": income.map({True: "Income", False: "Expenditure"}),
+        "Category": category.where(category.notna(), income.map({True: "", False: DEFAULT_CATEGORY})),
+        "Description": chunk["Description"].fillna("").astype(str).str.strip(),
+        "Amount": chunk["Amount"].abs(),
+    })
+
+
+#Import a statement file (path or file object) into `backend`, returns rows imported
+def import_statement(source, backend, fmt=None, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    fmt = fmt or detect_format(getattr(source, "name", source))
+    imported = 0
+    for chunk in READERS[fmt](source, chunk_rows=chunk_rows, dayfirst=dayfirst):
+        rows = to_expenses(chunk)
+        if len(rows):
+            backend.post_frame(rows)
+            imported += len(rows)
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a bank statement into the expense tracker")
+    parser.add_argument("statement")
+    parser.add_argument("--format", choices=sorted(READERS))
+    parser.add_argument("--dayfirst", action="store_true", help="dates are written day first (31/01/2024)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    count = import_statement(args.statement, storage.get_backend(), args.format, args.chunk_rows, args.dayfirst)
+    print(f"Imported {count} transactions from {args.statement}")
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+# Running balance engine for the expenses ledger.
+# The "Bank Balance" stored on the last row is the current balance, so posting a
+# transaction only needs the tail of the store and the new row carries its own balance
+# (one append, nothing else to keep in sync). Balances as of a past date come from a
+# prefix-sum index over calendar days.
+
+SIGN = {"Income": 1.0, "Expenditure": -1.0}
+#free days kept after the last transaction so new ones don't force a rebuild
+SPARE_DAYS = 366
+
+
+def signed_amounts(df):
+    amounts = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0)
+    return amounts * df["Transaction"].astype(object).map(SIGN).fillna(0.0)
+
+
+def day_number(date):
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype("int64"))
+
+
+def day_numbers(dates):
+    days = pd.to_datetime(dates, errors="coerce").values.astype("datetime64[D]")
+    return days.astype("int64"), ~np.isnat(days)
+
+
+# Fenwick (binary indexed) tree over calendar days: both adding an amount on a day and
+# summing everything up to a day are O(log days), in whatever order dates arrive.
+class BalanceIndex:
+
+    def __init__(self, first_day, daily):
+        self._build(first_day, daily)
+
+    def _build(self, first_day, daily):
+        self.first_day = first_day
+        self.daily = np.asarray(daily, dtype=float)
+        prefix = np.concatenate([[0.0], np.cumsum(self.daily)])
+        idx = np.arange(1, len(self.daily) + 1)
+        self.tree = (prefix[idx] - prefix[idx - (idx & -idx)]).tolist()
+
+    @classmethod
+    def from_days(cls, days, amounts):
+        if len(days) == 0:
+            return cls(0, np.zeros(0))
+        first = int(days.min())
+        size = int(days.max()) - first + 1 + SPARE_DAYS
+        return cls(first, np.bincount(days - first, weights=amounts, minlength=size))
+
+    def add(self, day, amount):
+        i = day - self.first_day
+        if i < 0 or i >= len(self.daily):
+            self._grow(day)
+            i = day - self.first_day
+        self.daily[i] += amount
+        i += 1
+        while i <= len(self.tree):
+            self.tree[i - 1] += amount
+            i += i & -i
+
+    #many days at once: one vectorized rebuild of the tree instead of a walk per row
+    def add_many(self, days, amounts):
+        if len(days) == 0:
+            return
+        days = np.asarray(days, dtype="int64")
+        if len(self.daily) == 0 or days.min() < self.first_day or days.max() >= self.first_day + len(self.daily):
+            self._grow(int(days.min()))
+            self._grow(int(days.max()))
+        daily = self.daily.copy()
+        np.add.at(daily, days - self.first_day, amounts)
+        self._build(self.first_day, daily)
+
+    #sum of everything posted on or before `day`
+    def total_until(self, day):
+        i = min(day - self.first_day + 1, len(self.tree))
+        total = 0.0
+        while i > 0:
+            total += self.tree[i - 1]
+            i -= i & -i
+        return total
+
+    def _grow(self, day):
+        if len(self.daily) == 0:
+            first, daily = day, np.zeros(0)
+        else:
+            first = min(self.first_day, day)
+            daily = np.concatenate([np.zeros(self.first_day - first), self.daily])
+        size = max(len(daily), day - first + 1 + SPARE_DAYS)
+        self._build(first, np.concatenate([daily, np.zeros(size - len(daily))]))
+
+
+class Ledger:
+
+    def __init__(self, opening, balance, index, last_id=0):
+        self.opening = opening
+        self.balance = balance
+        self.index = index
+        self.last_id = last_id
+
+    #Build from the stored rows. The opening balance is recovered from the first row when
+    #there is one, `opening` (the balance the user entered) only matters for an empty ledger.
+    @classmethod
+    def from_frame(cls, df, opening):
+        signed = signed_amounts(df)
+        days, valid = day_numbers(df["Date"])
+        index = BalanceIndex.from_days(days[valid], signed.values[valid])
+        balances = pd.to_numeric(df["Bank Balance"], errors="coerce")
+        if len(df) and pd.notna(balances.iloc[0]):
+            opening = float(balances.iloc[0] - signed.iloc[0])
+        balance = float(opening + signed.sum())
+        if len(df) and pd.notna(balances.iloc[-1]):
+            balance = float(balances.iloc[-1])
+        last_id = 0
+        if "ID" in df.columns and len(df):
+            ids = pd.to_numeric(df["ID"], errors="coerce")
+            last_id = int(ids.max()) if ids.notna().any() else 0
+        return cls(float(opening), balance, index, last_id)
+
+    #Built from an iterable of expense frames in ID order (like from_frame on all of them
+    #together). Only the per-day totals of each chunk are kept, not its rows.
+    @classmethod
+    def from_chunks(cls, chunks, opening):
+        day_parts, total_parts = [], []
+        first = last = None
+        total, last_id = 0.0, 0
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            signed = signed_amounts(chunk)
+            days, valid = day_numbers(chunk["Date"])
+            chunk_days, positions = np.unique(days[valid], return_inverse=True)
+            day_parts.append(chunk_days)
+            total_parts.append(np.bincount(positions, weights=signed.values[valid], minlength=len(chunk_days)))
+            total += float(signed.sum())
+            balances = pd.to_numeric(chunk["Bank Balance"], errors="coerce")
+            if first is None:
+                first = (balances.iloc[0], signed.iloc[0])
+            last = balances.iloc[-1]
+            if "ID" in chunk.columns:
+                ids = pd.to_numeric(chunk["ID"], errors="coerce")
+                if ids.notna().any():
+                    last_id = max(last_id, int(ids.max()))
+        if first is not None and pd.notna(first[0]):
+            opening = float(first[0] - first[1])
+        balance = float(opening + total)
+        if last is not None and pd.notna(last):
+            balance = float(last)
+        days = np.concatenate(day_parts) if day_parts else np.zeros(0, dtype="int64")
+        totals = np.concatenate(total_parts) if total_parts else np.zeros(0)
+        return cls(float(opening), balance, BalanceIndex.from_days(days, totals), last_id)
+
+    #IDs for the next `count` transactions
+    def new_ids(self, count):
+        ids = np.arange(self.last_id + 1, self.last_id + 1 + count)
+        self.last_id += count
+        return ids
+
+    #Apply one transaction and return the running balance to store on its row
+    def post(self, date, transaction, amount):
+        signed = SIGN.get(transaction, 0.0) * float(amount)
+        self.balance += signed
+        self.index.add(day_number(date), signed)
+        return self.balance
+
+    #Apply a batch at once, returns the running balance after each transaction
+    def post_many(self, dates, transactions, amounts):
+        signed = pd.to_numeric(pd.Series(amounts), errors="coerce").fillna(0.0).values * \
+            pd.Series(transactions).map(SIGN).fillna(0.0).values
+        balances = self.balance + np.cumsum(signed)
+        days, valid = day_numbers(pd.Series(dates))
+        self.index.add_many(days[valid], signed[valid])
+        if len(balances):
+            self.balance = float(balances[-1])
+        return balances
+
+    def balance_as_of(self, date):
+        return self.opening + self.index.total_until(day_number(date))
+
+
+#Running balance after each row, starting from `opening`
+def running_balances(df, opening):
+    return opening + signed_amounts(df).cumsum()
+
+
+#Rows whose stored "Bank Balance" disagrees with the running balance recomputed from amounts
+def drifted_rows(df, opening, tolerance=0.005):
+    expected = running_balances(df, opening)
+    stored = pd.to_numeric(df["Bank Balance"], errors="coerce")
+    return df[(stored - expected).abs() > tolerance]
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Loans and debts.
+# Settling a row turns it into a ledger entry on the loan's date: a debt we paid back is an
+# Expenditure in category "Debt", a loan paid back to us is Income in category "Loan".
+# Entries for any number of rows are built with column operations, so a batch settle
+# is one vectorized post instead of one write per row.
+# A row can be paid back in parts: "Paid" holds what was paid so far, and the row is
+# "Partially Paid" until it reaches the Amount and becomes "Settled".
+
+UNPAID = "Unpaid"
+PARTIAL = "Partially Paid"
+SETTLED = "Settled"
+KINDS = ("Loan", "Debt")
+
+
+#Rows of `loans` that can still be settled
+def open_rows(loans):
+    return loans[loans["Transaction"].isin(KINDS) & (loans["Status"] != SETTLED)]
+
+
+#What is still owed on each row, 0 for settled rows
+def outstanding(loans):
+    amount = pd.to_numeric(loans["Amount"], errors="coerce").fillna(0.0)
+    paid = pd.to_numeric(loans["Paid"], errors="coerce").fillna(0.0) if "Paid" in loans.columns else 0.0
+    return (amount - paid).clip(lower=0.0).where(loans["Status"] != SETTLED, 0.0)
+
+
+#Ledger entries (Date, Transaction, Category, Description, Amount) paying back `amounts`
+#(by default everything outstanding) of every row of `loans`
+def settlement_entries(loans, amounts=None):
+    debt = (loans["Transaction"] == "Debt").to_numpy()
+    to = loans["To"].astype(str)
+    if amounts is None:
+        amounts = outstanding(loans)
+    return pd.DataFrame({
+        "Date": loans["Date"].values,
+        "Transaction": np.where(debt, "Expenditure", "Income"),
+        "Category": np.where(debt, "Debt", "Loan"),
+        "Description": np.where(debt, "settled debt with " + to, "Loan paid by " + to),
+        "Amount": np.asarray(amounts, dtype="float64"),
+    })
+
+
+#Loans and debts indexed by ID (hash lookups) and by (counterparty, status) (a sorted
+#MultiIndex, so a lookup is a binary search instead of a scan of every row)
+class LoanBook:
+
+    def __init__(self, loans):
+        self.frame = loans.reset_index(drop=True)
+        self.by_id = pd.Index(pd.to_numeric(self.frame["ID"], errors="coerce"))
+        keys = pd.MultiIndex.from_arrays([self.frame["To"].astype(object), self.frame["Status"].astype(object)],
+                                         names=["To", "Status"])
+        order = keys.argsort()
+        self.keys = keys[order]
+        self.positions = np.asarray(order)
+
+    def __len__(self):
+        return len(self.frame)
+
+    #rows with these IDs, unknown IDs are left out
+    def rows(self, ids):
+        positions = self.by_id.get_indexer(list(ids))
+        return self.frame.iloc[positions[positions >= 0]]
+
+    def find(self, to, status=None):
+        key = (to,) if status is None else (to, status)
+        if not len(self.keys):
+            return self.frame.iloc[[]]
+        try:
+            found = self.keys.get_locs(key)
+        except KeyError:
+            return self.frame.iloc[[]]
+        return self.frame.iloc[np.sort(self.positions[found])]
+
+
+#Net position per counterparty: what they still owe us (loans) and what we still owe them
+#(debts). Built once with a groupby, then updated in place on every register and payment,
+#so "who owes me what" never scans the loans.
+class Positions:
+
+    def __init__(self, owed_to_me, owed_by_me):
+        self.owed_to_me = owed_to_me
+        self.owed_by_me = owed_by_me
+
+    @classmethod
+    def from_frame(cls, loans):
+        left = outstanding(loans)
+        to = loans["To"].astype(object)
+        kind = loans["Transaction"]
+        return cls(left[kind == "Loan"].groupby(to[kind == "Loan"]).sum().to_dict(),
+                   left[kind == "Debt"].groupby(to[kind == "Debt"]).sum().to_dict())
+
+    #a new loan/debt adds `amount`, a payment adds minus what was paid
+    def add(self, to, kind, amount):
+        totals = self.owed_to_me if kind == "Loan" else self.owed_by_me
+        totals[to] = totals.get(to, 0.0) + float(amount)
+
+    #apply a batch of (to, kind, amount) columns
+    def add_frame(self, to, kind, amounts):
+        for (name, k), value in pd.Series(np.asarray(amounts, dtype="float64")).groupby(
+                [np.asarray(to, dtype=object), np.asarray(kind, dtype=object)]).sum().items():
+            self.add(name, k, value)
+
+    #positive: they owe us, negative: we owe them
+    def net(self, to):
+        return self.owed_to_me.get(to, 0.0) - self.owed_by_me.get(to, 0.0)
+
+    def total_owed_to_me(self):
+        return sum(self.owed_to_me.values())
+
+    def total_owed_by_me(self):
+        return sum(self.owed_by_me.values())
+
+    #one row per counterparty with anything outstanding, largest net first
+    def table(self):
+        names = sorted(set(self.owed_to_me) | set(self.owed_by_me), key=str)
+        df = pd.DataFrame({"To": names,
+                           "Owes Me": [self.owed_to_me.get(n, 0.0) for n in names],
+                           "I Owe": [self.owed_by_me.get(n, 0.0) for n in names]})
+        df["Net"] = df["Owes Me"] - df["I Owe"]
+        df = df[(df["Owes Me"].abs() > 0.005) | (df["I Owe"].abs() > 0.005)]
+        return df.sort_values("Net", ascending=False, kind="stable").reset_index(drop=True)
@@ -0,0 +1,69 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    #no advisory file locks (Windows): writers are still serialized within one process
+    fcntl = None
+
+# Advisory inter-process locks.
+# A FileLock is an flock() on a small lock file next to the data, held while a writer
+# reads the current state and writes its change, so two processes (the app and a
+# separate scheduler, or two servers on one data folder) never interleave writes.
+# Threads of one process are serialized by an RLock in front of it, and the lock is
+# re-entrant: the flock is only taken by the outermost acquire of a thread.
+
+
+class FileLock:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            try:
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self._close()
+                self._depth -= 1
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self._depth == 1:
+                self._close()
+        finally:
+            self._depth -= 1
+            self._lock.release()
+
+    #True for the outermost acquire of the thread holding the lock
+    def outermost(self):
+        return self._depth == 1
+
+    #closing the file releases the flock
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+#The one FileLock of this process for `path`
+def lock_for(path):
+    path = os.path.abspath(path)
+    with _locks_lock:
+        if path not in _locks:
+            _locks[path] = FileLock(path)
+        return _locks[path]
@@ -0,0 +1,145 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Keyset (cursor) paging for the tables the app shows.
+# A page is the `limit` rows following a cursor in (sort column, ID) order, the cursor
+# being the (key, ID) of the last row shown. Unlike an offset, a cursor stays on the same
+# row when rows are added or removed in front of it, and finding it is a binary search.
+# Keys are plain values (dates as "YYYY-MM-DD", numbers, text), so a cursor can be kept
+# in the session or sent to a client and handed back as is.
+
+PAGE_SIZE = 50
+DATE_COLUMNS = ("Date", "Start Date", "Next Due")
+NUMBER_COLUMNS = ("ID", "Amount", "Bank Balance", "Paid")
+MISSING_DAY = np.iinfo("int64").min
+
+
+#Sort keys for a column: dates as day numbers, missing dates and text sort first, missing
+#numbers last (NaN)
+def sort_keys(values, column):
+    if column in DATE_COLUMNS:
+        days = pd.to_datetime(values, errors="coerce").to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        #NaT becomes the smallest int64
+        return days.astype("int64")
+    if column in NUMBER_COLUMNS:
+        return pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64")
+    return np.asarray(values.astype(object).where(values.notna(), "").astype(str), dtype=str)
+
+
+#sort key -> the value a cursor holds, and back
+def _cursor_value(key, column):
+    if column in DATE_COLUMNS:
+        return "" if key == MISSING_DAY else str(np.datetime64(int(key), "D"))
+    return key.item() if isinstance(key, np.generic) else key
+
+
+def _sort_key(value, column):
+    if column in DATE_COLUMNS:
+        return MISSING_DAY if value == "" else np.datetime64(value, "D").astype("int64")
+    return value
+
+
+#One page of rows. `next` / `prev` are the cursors of the pages after and before it
+#(pass them back as after= / before=), None at either end
+class Page:
+
+    def __init__(self, rows, next, prev):
+        self.rows = rows
+        self.next = next
+        self.prev = prev
+
+    def __len__(self):
+        return len(self.rows)
+
+
+#A frame with its rows ordered by (column, ID), built once per column and dataset version
+class SortedView:
+
+    def __init__(self, frame, column):
+        self.frame = frame
+        self.column = column
+        keys = sort_keys(frame[column], column)
+        ids = pd.to_numeric(frame["ID"], errors="coerce").fillna(-1).to_numpy(dtype="int64")
+        order = np.lexsort((ids, keys))
+        self.order = order
+        self.keys = keys[order]
+        self.ids = ids[order]
+
+    def __len__(self):
+        return len(self.frame)
+
+    #The same view with only the rows of the frame where `mask` is True, for paging
+    #through a filter without applying its mask on every page
+    def subset(self, mask):
+        keep = np.asarray(mask, dtype=bool)[self.order]
+        view = copy.copy(self)
+        view.order, view.keys, view.ids = self.order[keep], self.keys[keep], self.ids[keep]
+        return view
+
+    #(positions in key order, keys, ids, more rows beyond them, rows on the cursor's other side)
+    #of up to `limit` rows after (`forward`) or before the cursor, `mask` picks rows of the frame
+    def window(self, cursor, forward, limit, mask=None):
+        order, keys, ids = self.order, self.keys, self.ids
+        if mask is not None:
+            keep = np.asarray(mask, dtype=bool)[order]
+            order, keys, ids = order[keep], keys[keep], ids[keep]
+        if cursor is None:
+            at = 0 if forward else len(order)
+        else:
+            key, row_id = _sort_key(cursor[0], self.column), cursor[1]
+            lo = int(np.searchsorted(keys, key, "left"))
+            hi = int(np.searchsorted(keys, key, "right"))
+            at = lo + int(np.searchsorted(ids[lo:hi], row_id, "right" if forward else "left"))
+        if forward:
+            part = slice(at, at + limit)
+            more, other = at + limit < len(order), at > 0
+        else:
+            part = slice(max(0, at - limit), at)
+            more, other = at - limit > 0, at < len(order)
+        return order[part], keys[part], ids[part], more, other
+
+
+#The page after cursor `after` (or before cursor `before`, or the first page) of the rows
+#of `views` chosen by their masks, given as [(SortedView, mask or None), ...]. Several views
+#(a large cached one and a few fresh rows) are merged as if they were one.
+def page(views, after=None, before=None, limit=PAGE_SIZE, descending=False):
+    cursor = after if after is not None else before
+    #descending order walks the keys backwards
+    forward = (before is None) != descending
+    parts, more, other = [], False, False
+    for view, mask in views:
+        positions, keys, ids, view_more, view_other = view.window(cursor, forward, limit, mask)
+        parts.append(pd.DataFrame({"view": len(parts), "position": positions, "key": keys, "id": ids}))
+        more, other = more or view_more, other or view_other
+    #nearest to the cursor first, then in the order shown
+    found = pd.concat(parts, ignore_index=True).sort_values(
+        ["key", "id"], ascending=forward, na_position="last" if forward else "first", kind="stable")
+    more = more or len(found) > limit
+    found = found.iloc[:limit].sort_values(
+        ["key", "id"], ascending=not descending, na_position="first" if descending else "last", kind="stable")
+    rank = np.arange(len(found))
+    pieces, ranks = [], []
+    for number, (view, _) in enumerate(views):
+        chosen = (found["view"] == number).to_numpy()
+        pieces.append(view.frame.iloc[found["position"].to_numpy()[chosen]])
+        ranks.append(rank[chosen])
+    rows = pd.concat(pieces).iloc[np.argsort(np.concatenate(ranks), kind="stable")]
+    if found.empty:
+        return make_page(rows, None, None, more, other, before is not None)
+    column = views[0][0].column
+    first = (_cursor_value(found["key"].iloc[0], column), int(found["id"].iloc[0]))
+    last = (_cursor_value(found["key"].iloc[-1], column), int(found["id"].iloc[-1]))
+    return make_page(rows, first, last, more, other, before is not None)
+
+
+#A Page of `rows` whose first and last rows have cursors `first` and `last`. `more`: there
+#are rows past them in the direction paged, `other`: there are rows on the cursor's other
+#side, `backwards`: the page was asked for with before=
+def make_page(rows, first, last, more, other, backwards):
+    if len(rows) == 0:
+        return Page(rows, None, None)
+    if backwards:
+        return Page(rows, last if other else None, first if more else None)
+    return Page(rows, last if more else None, first if other else None)
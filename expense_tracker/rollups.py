@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Precomputed totals of the expenses ledger, per transaction type, per category, per day
+# and per month, plus the TOP biggest expenditures. Built once with vectorized groupbys
+# and then updated one transaction at a time, so the dashboard tiles and Analytics
+# metrics never scan the rows.
+# Every part is mergeable (sums add up, the top rows of two parts are a heap merge), so
+# rollups can also be built one chunk of rows at a time with from_chunks(): only one
+# chunk and the totals (bounded by the number of days and categories) are in memory.
+# The cached rollups are shared by every session and the scheduler thread: updates hold
+# the rollups' lock and readers copy what they iterate under it.
+
+#every build or update gets a new version, charts drawn from the rollups are keyed on it
+_versions = itertools.count(1)
+TOP = 5
+
+
+def _category(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)) or value == "":
+        return None
+    return value
+
+
+#Keep the TOP largest of min-heap `heap` when adding (amount, -ID, date, category, description),
+#on equal amounts the earlier row (larger -ID) stays, like nlargest()
+def _push(heap, item):
+    if len(heap) < TOP:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+#(amount, -ID, date, category, description) of the TOP biggest expenditures of a frame
+def _top_rows(df, amounts, transaction, dates):
+    spent = amounts.where(transaction == "Expenditure").reset_index(drop=True).nlargest(TOP)
+    ids = pd.to_numeric(df["ID"]).to_numpy() if "ID" in df.columns else np.arange(len(df))
+    category = df["Category"].astype(object).where(df["Category"].notna(), "").to_numpy()
+    description = df["Description"].astype(object).where(df["Description"].notna(), "").to_numpy()
+    dates = dates.to_numpy()
+    heap = [(float(amount), -ids[i].item(), pd.Timestamp(dates[i]), category[i], description[i])
+            for i, amount in spent.items()]
+    heapq.heapify(heap)
+    return heap
+
+
+class Rollups:
+
+    def __init__(self, by_type, by_category, by_day, by_month, top=None):
+        self.by_type = by_type
+        self.by_category = by_category
+        self.by_day = by_day
+        self.by_month = by_month
+        self.top = [] if top is None else top
+        self.version = next(_versions)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df):
+        amounts = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0)
+        transaction = df["Transaction"]
+        category = df["Category"].replace("", None)
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        return cls(
+            amounts.groupby(transaction).sum().to_dict(),
+            amounts.groupby([transaction, category]).sum().to_dict(),
+            amounts.groupby([dates.dt.normalize(), transaction]).sum().to_dict(),
+            amounts.groupby([dates.dt.to_period("M"), transaction]).sum().to_dict(),
+            _top_rows(df, amounts, transaction, dates),
+        )
+
+    #Built from an iterable of expense frames, merging the rollups of each one
+    @classmethod
+    def from_chunks(cls, chunks):
+        totals = cls({}, {}, {}, {})
+        for chunk in chunks:
+            totals.merge(cls.from_frame(chunk))
+        return totals
+
+    def add(self, date, transaction, category, amount, description="", row_id=0):
+        amount = float(amount)
+        category = _category(category)
+        date = pd.Timestamp(date)
+        day = (date.normalize(), transaction)
+        month = (date.to_period("M"), transaction)
+        with self._lock:
+            self.by_type[transaction] = self.by_type.get(transaction, 0.0) + amount
+            if category is not None:
+                key = (transaction, category)
+                self.by_category[key] = self.by_category.get(key, 0.0) + amount
+            self.by_day[day] = self.by_day.get(day, 0.0) + amount
+            self.by_month[month] = self.by_month.get(month, 0.0) + amount
+            if transaction == "Expenditure":
+                _push(self.top, (amount, -row_id, date, category or "", description))
+            self.version = next(_versions)
+
+    #Add a whole frame of new transactions with vectorized groupbys
+    def add_frame(self, df):
+        self.merge(self.from_frame(df))
+
+    #Add the totals of `other` (rollups of other rows) to these
+    def merge(self, other):
+        with self._lock:
+            for totals, added in ((self.by_type, other.by_type), (self.by_category, other.by_category),
+                                  (self.by_day, other.by_day), (self.by_month, other.by_month)):
+                for key, value in added.items():
+                    totals[key] = totals.get(key, 0.0) + value
+            for item in other.top:
+                _push(self.top, item)
+            self.version = next(_versions)
+
+    #a copy of one of the totals dicts (or the top rows) that later updates don't touch
+    def _snapshot(self, totals):
+        with self._lock:
+            return totals.copy()
+
+    def total(self, transaction):
+        return self.by_type.get(transaction, 0.0)
+
+    def net(self):
+        return self.total("Income") - self.total("Expenditure")
+
+    #Amount per category for one transaction type, like groupby("Category")["Amount"].sum()
+    def category_totals(self, transaction="Expenditure"):
+        totals = {c: v for (t, c), v in self._snapshot(self.by_category).items() if t == transaction}
+        return pd.Series(totals, dtype=float).rename_axis("Category").sort_index()
+
+    #Amount per month (PeriodIndex) for one transaction type
+    def monthly_totals(self, transaction="Expenditure"):
+        totals = {m: v for (m, t), v in self._snapshot(self.by_month).items() if t == transaction}
+        if not totals:
+            return pd.Series(dtype=float)
+        return pd.Series(totals).rename_axis("Date").sort_index()
+
+    #Amount per day with one column per transaction type, missing days/types are 0
+    def daily_totals(self):
+        by_day = self._snapshot(self.by_day)
+        if not by_day:
+            return pd.DataFrame()
+        return pd.Series(by_day).rename_axis(["Date", "Transaction"]).unstack(fill_value=0).sort_index()
+
+    #The TOP biggest expenditures, largest first, like nlargest(TOP, "Amount") of the Expenditure rows
+    def top_expenses(self):
+        rows = sorted(self._snapshot(self.top), reverse=True)
+        return pd.DataFrame([(date, category, description, amount) for amount, _, date, category, description in rows],
+                            columns=["Date", "Category", "Description", "Amount"])
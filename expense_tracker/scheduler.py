@@ -0,0 +1,217 @@
+import datetime
+import heapq
+import os
+import threading
+
+from . import autopay_schedule
+from . import storage
+from . import telemetry
+from . import tenants
+
+# Background autopay scheduler.
+# The autopay table is the persisted queue (Next Due is saved with every rule, and the
+# SQLite backend indexes it); the scheduler keeps a heap of (earliest Next Due, backend)
+# built from it and sleeps until the earliest rule falls due. When that happens it posts
+# every due payment of that backend through Backend.run_autopay() and rebuilds its entry.
+# Saving autopay wakes it up early. Every RECHECK_SECONDS it also compares each backend's
+# autopay version with the one its entry was built from, in case another process edited
+# the rules, and only rereads the ones that changed.
+# A backend that fails is skipped (the others go on) and retried on the next recheck; the
+# error is kept in `last_error` and, with telemetry on, as the status of its span.
+#
+# In multi-user mode one TenantScheduler thread watches every tenant, with one heap entry
+# per tenant taken from the registry's due index, and opens a tenant only when it is due.
+#
+# The Streamlit app starts one per server process. Set EXPENSE_TRACKER_SCHEDULER=off there
+# when running `python -m expense_tracker.scheduler` as a separate process instead.
+
+RECHECK_SECONDS = 3600
+RETRY_SECONDS = 60
+
+
+class AutopayScheduler(threading.Thread):
+
+    #`backend` is watched under the key "", more (one per tenant) can be added with add()
+    def __init__(self, backend=None, today=datetime.date.today):
+        super().__init__(name="autopay-scheduler", daemon=True)
+        self.today = today
+        self._wake = threading.Condition()
+        self._stopped = False
+        self.backends = {}
+        self.next_due = {}
+        self.versions = {}
+        self.last_error = None
+        self._dirty = set()
+        self.heap = []
+        if backend is not None:
+            self.add("", backend)
+
+    def add(self, key, backend):
+        with self._wake:
+            if key in self.backends:
+                return
+            self.backends[key] = backend
+        backend.subscribe("autopay", lambda: self.poke(key))
+        self.poke(key)
+
+    #called whenever autopay is saved
+    def poke(self, key=""):
+        with self._wake:
+            self._dirty.add(key)
+            self._wake.notify()
+
+    def stop(self):
+        with self._wake:
+            self._stopped = True
+            self._wake.notify()
+
+    def _backend(self, key):
+        return self.backends[key]
+
+    #after a run, the backend's entry is rebuilt from its rules
+    def _ran(self, key):
+        self.poke(key)
+
+    def _rebuild(self):
+        with self._wake:
+            dirty = self._dirty & set(self.backends)
+            self._dirty = set()
+        for key in dirty:
+            backend = self.backends[key]
+            try:
+                with telemetry.span("autopay.next_due", tenant=key):
+                    self.versions[key] = backend.version("autopay")
+                    self.next_due[key] = autopay_schedule.earliest_due(backend.load_autopay())
+            except Exception as exc:
+                #one broken tenant must not hold up the others
+                self._failed(key, exc)
+        self.heap = [(due, key) for key, due in self.next_due.items() if due is not None]
+        heapq.heapify(self.heap)
+
+    #seconds until local midnight of the earliest Next Due, capped by RECHECK_SECONDS
+    def _seconds_to_next(self):
+        if not self.heap:
+            return RECHECK_SECONDS
+        due_at = datetime.datetime.combine(self.heap[0][0], datetime.time.min)
+        return min(max((due_at - datetime.datetime.now()).total_seconds(), 0), RECHECK_SECONDS)
+
+    def run_pending(self):
+        self._rebuild()
+        today = self.today()
+        posted = 0
+        while self.heap and self.heap[0][0] <= today:
+            _, key = heapq.heappop(self.heap)
+            try:
+                with telemetry.span("autopay.scheduled", tenant=key):
+                    posted += self._backend(key).run_autopay(today)
+            except Exception as exc:
+                self._failed(key, exc)
+                continue
+            self._ran(key)
+        self._rebuild()
+        return posted
+
+    #forget the entry of `key` (None: the whole pass failed); with no version on record
+    #the next recheck rereads it
+    def _failed(self, key, exc):
+        self.last_error = (key, exc)
+        self.next_due.pop(key, None)
+        self.versions.pop(key, None)
+
+    #backends whose rules changed since their entry was built, without loading the rules
+    def _recheck(self):
+        changed = set()
+        for key, backend in list(self.backends.items()):
+            try:
+                if backend.version("autopay") != self.versions.get(key):
+                    changed.add(key)
+            except Exception as exc:
+                self._failed(key, exc)
+        with self._wake:
+            self._dirty |= changed
+
+    def run(self):
+        while True:
+            with self._wake:
+                if self._stopped:
+                    return
+            wait = None
+            try:
+                self.run_pending()
+            except Exception as exc:
+                #keep the thread alive and retry a bit later
+                self._failed(None, exc)
+                wait = RETRY_SECONDS
+            with self._wake:
+                if self._stopped:
+                    return
+                poked = bool(self._dirty) or self._wake.wait(wait if wait is not None else self._seconds_to_next())
+            if not poked:
+                self._recheck()
+
+
+# Tenants are keys into the registry's due index rather than open backends: every tenant's
+# autopay save updates the index and pokes the scheduler, the recheck rereads the index
+# (other processes update it too). Tenants missing from the index (accounts made before
+# it existed) are opened once, on the first pass, to fill it in.
+class TenantScheduler(AutopayScheduler):
+
+    def __init__(self, registry, today=datetime.date.today):
+        super().__init__(today=today)
+        self.registry = registry
+        self.failing = set()
+        self._seeded = False
+        registry.subscribe(self.poke)
+
+    def _backend(self, key):
+        return self.registry.backend(key)
+
+    #the run saved the tenant's rules, which updated the index, unless none were due after
+    #all (rules edited by a process that didn't update it): refresh the entry either way
+    def _ran(self, key):
+        self.registry.refresh_due(key)
+
+    def _rebuild(self):
+        with self._wake:
+            self._dirty = set()
+        if not self._seeded:
+            self._seeded = True
+            known = self.registry.due.load()
+            for tenant in self.registry.users.tenants():
+                if tenant not in known:
+                    try:
+                        self.registry.refresh_due(tenant)
+                    except Exception as exc:
+                        self._failed(tenant, exc)
+        self.next_due = {key: due for key, due in self.registry.due.load().items()
+                         if due is not None and key not in self.failing}
+        self.heap = [(due, key) for key, due in self.next_due.items()]
+        heapq.heapify(self.heap)
+
+    #failing tenants are left out until the next recheck
+    def _failed(self, key, exc):
+        super()._failed(key, exc)
+        self.failing.add(key)
+
+    def _recheck(self):
+        with self._wake:
+            self.failing = set()
+            self._dirty.add(None)
+
+
+def for_tenants(registry):
+    return TenantScheduler(registry)
+
+
+def enabled():
+    return os.environ.get("EXPENSE_TRACKER_SCHEDULER", "on").lower() not in ("0", "off", "false", "no")
+
+
+if __name__ == "__main__":
+    #dedicated scheduler process: python -m expense_tracker.scheduler
+    if tenants.enabled():
+        scheduler = for_tenants(tenants.get_tenants())
+    else:
+        scheduler = AutopayScheduler(storage.get_backend())
+    scheduler.start()
+    scheduler.join()
@@ -0,0 +1,1431 @@
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from . import autopay_schedule
+from . import ledger as ledger_engine
+from . import loan_book
+from . import locking
+from . import paging
+from . import telemetry
+from . import transaction_log
+from .expense_index import ExpenseIndex
+from .rollups import Rollups
+
+#every row has a stable "ID", unique within its dataset and never reused for another row
+EXPENSE_COLUMNS = ["ID","Date","Transaction","Category","Description","Amount","Bank Balance"]
+#"Paid" is how much of a loan/debt has been paid back so far
+LOAN_COLUMNS = ["ID","Date","Transaction","To","Description","Amount","Status","Paid"]
+AUTOPAY_COLUMNS = ["ID","Start Date","Transaction","Category","Description","Amount","Frequency","Next Due"]
+DEFAULT_BALANCE = 10000
+#cached datasets built from another one, dropped together with it
+DEPENDENTS = {"expenses": ("expense_index", "expenses_pages"), "loans": ("loan_book", "positions", "loans_pages"),
+              "autopay": ("autopay_pages",)}
+COLUMNS = {"expenses": EXPENSE_COLUMNS, "loans": LOAN_COLUMNS, "autopay": AUTOPAY_COLUMNS}
+#values for columns missing from rows saved before the column existed
+DEFAULTS = {"loans": {"Paid": 0.0}}
+#stored datasets each cached value is built from
+SOURCES = {"expenses": ("expenses",), "expense_index": ("expenses",), "expenses_pages": ("expenses",),
+           "ledger": ("expenses", "balance"), "rollups": ("expenses",), "loans": ("loans",),
+           "loan_book": ("loans",), "positions": ("loans",), "loans_pages": ("loans",),
+           "autopay": ("autopay",), "autopay_pages": ("autopay",), "balance": ("balance",)}
+#rows per chunk when the expenses are streamed instead of loaded (see expense_chunks)
+CHUNK_ROWS = 100_000
+
+
+def date_str(date):
+    if isinstance(date, str):
+        return date
+    return date.strftime("%Y-%m-%d")
+
+
+def _file_identity(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+#Write a file through `write(tmp_path)`, then fsync and rename it over `path`: readers and a
+#crash see either the old or the new file, never a half-written one
+def replace_file(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    transaction_log._fsync_dir(path)
+
+
+#`df` with only the dataset's columns (the app's "Select" checkboxes are never stored) and
+#an ID on every row: rows without one get the next IDs after the largest in use
+def with_ids(df, columns):
+    df = df.reindex(columns=columns)
+    #float64, so the nullable Int64 IDs of the parquet/arrow backends take the new ones too
+    ids = pd.to_numeric(df["ID"], errors="coerce").astype("float64")
+    missing = ids.isna()
+    if missing.any():
+        start = int(ids.max()) if ids.notna().any() else 0
+        ids.loc[missing] = np.arange(start + 1, start + 1 + int(missing.sum()))
+    df["ID"] = ids.astype("int64")
+    return df
+
+
+def _row_key(value):
+    if isinstance(value, str):
+        return value
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _row_keys(df, columns):
+    return [tuple(_row_key(v) for v in row) for row in df.reindex(columns=columns).itertuples(index=False)]
+
+
+#Three-way merge of tables whose rows have no ids: the rows `mine` added to / removed from
+#`base` are added to / removed from `theirs` (a changed row is one removed plus one added),
+#so neither side's changes are lost. Rows are compared on `columns`.
+def merge_rows(base, mine, theirs, columns):
+    base_left = Counter(_row_keys(base, columns))
+    added = []
+    for i, key in enumerate(_row_keys(mine, columns)):
+        if base_left[key] > 0:
+            base_left[key] -= 1
+        else:
+            added.append(i)
+    #what is left of base is what `mine` removed or changed
+    kept = []
+    for i, key in enumerate(_row_keys(theirs, columns)):
+        if base_left[key] > 0:
+            base_left[key] -= 1
+        else:
+            kept.append(i)
+    merged = pd.concat([theirs.iloc[kept], mine.iloc[added]], ignore_index=True)
+    if "ID" in merged.columns:
+        #a row both sides changed keeps our version
+        ids = pd.to_numeric(merged["ID"], errors="coerce")
+        merged = merged[ids.isna() | ~ids.duplicated(keep="last")].reset_index(drop=True)
+    return merged.reindex(columns=mine.columns)
+
+
+# --- Backend interface ---
+# Every backend loads/saves the same four datasets as DataFrames with the columns above.
+# Subclasses implement the _read_*/_write_* methods; the public load_*/save_* methods add
+# a cache shared by every rerun and session in this process. A cached frame is reused
+# while the files behind it keep the same identity (inode/size/mtime) and no save_* has
+# bumped its generation counter, so a write only refreshes the dataset it touched.
+# The query helpers have a generic DataFrame implementation here; backends that can
+# answer them without loading everything (SQLite) override them.
+#
+# Writers hold write_lock(), which also locks out other processes, and saves can be
+# compare-and-swap: checkout() hands out a dataset with its version, and a save_* given
+# that as `base` merges in whatever another writer saved since instead of overwriting it.
+# Writes that must happen together (settling a debt: a transaction and the loan's status)
+# go in a `with backend.transaction():` block, which commits all of them or none.
+class Backend:
+
+    def __init__(self):
+        self._cache = {}
+        self._generation = {}
+        self._cache_lock = threading.Lock()
+        self._listeners = {}
+
+    #files whose identity decides whether a cached dataset is still current
+    def _files(self, name):
+        return []
+
+    #lock file shared by every writer of this backend's data, in any process
+    def _lock_path(self):
+        raise NotImplementedError
+
+    #Held by every write. The first writer to take it after a crash finishes the
+    #transaction that was being committed (see _recover)
+    @contextlib.contextmanager
+    def write_lock(self):
+        with locking.lock_for(self._lock_path()) as held:
+            if held.outermost():
+                self._recover()
+            yield
+
+    def _recover(self):
+        pass
+
+    #Every write goes through here: "append" (rows with their balance), "expenses", "loans",
+    #"loan_rows" (loans written by ID), "autopay" or "balance". Backends with transactions
+    #hold writes back until commit.
+    def _store(self, name, value):
+        with telemetry.span("save." + name):
+            {"append": self._append_expenses, "expenses": self._write_expenses, "loans": self._write_loans,
+             "loan_rows": self._write_loan_rows, "autopay": self._write_autopay,
+             "balance": self._write_balance}[name](value)
+
+    #Write only these loan rows: new IDs are added, existing ones replaced. Backends that
+    #keep the loans in one file have to rewrite it, SQLite overrides this with an upsert.
+    def _write_loan_rows(self, rows):
+        loans = self._read_loans()
+        kept = loans[~loans["ID"].isin(rows["ID"])]
+        loans = pd.concat([kept, rows], ignore_index=True) if len(kept) else rows
+        self._write_loans(loans.sort_values("ID", kind="stable"))
+
+    #All writes made in the block are committed together, or none of them if it raises
+    def transaction(self):
+        raise NotImplementedError
+
+    #Run `write` keeping the cached entries of `names` that are current now: for writes
+    #whose effect the cached values (the ledger and rollups updated in memory) already show
+    def _keeping_cache(self, write, names=("ledger", "rollups")):
+        with self._cache_lock:
+            kept = {name: self._cache[name][1] for name in names
+                    if name in self._cache and self._cache[name][0] == self._cache_key(name)}
+        write()
+        with self._cache_lock:
+            for name, value in kept.items():
+                self._cache[name] = (self._cache_key(name), value)
+
+    #after a rollback the in-memory ledger and rollups may hold writes that never happened
+    def _rolled_back(self):
+        for name in ("expenses", "ledger", "rollups", "loans", "autopay", "balance"):
+            self.invalidate(name)
+
+    #Version of a dataset as stored: changes with every write, from any process
+    def version(self, name):
+        return tuple(_file_identity(p) for p in self._files(name))
+
+    #(frame, version) of a dataset, pass it back as save_*(..., base=) to save with a version check
+    def checkout(self, name):
+        version = self.version(name)
+        return {"expenses": self.load_expenses, "loans": self.load_loans,
+                "autopay": self.load_autopay}[name](), version
+
+    #With `base` (from checkout) and another save of `name` after it, merge that save
+    #and `df` instead of overwriting it. Holds the write lock, returns what was written.
+    def _checked_write(self, name, df, base):
+        with self.write_lock():
+            if base is not None:
+                base_df, version = base
+                if self.version(name) != version:
+                    current = {"expenses": self.load_expenses, "loans": self.load_loans,
+                               "autopay": self.load_autopay}[name]()
+                    df = merge_rows(base_df, df, current, COLUMNS[name])
+                    if name == "expenses":
+                        df = self._rebalanced(df, current)
+            df = with_ids(df, COLUMNS[name]).fillna(DEFAULTS.get(name, {}))
+            self._store(name, df)
+            self.invalidate(name)
+        return df
+
+    #merged expenses get their running balances recomputed from the stored opening balance
+    def _rebalanced(self, df, current):
+        opening = ledger_engine.Ledger.from_frame(current, self.opening_balance()).opening
+        df = df.copy()
+        df["Bank Balance"] = ledger_engine.running_balances(df, opening).values
+        return df
+
+    def _cache_key(self, name):
+        return (self._generation.get(name, 0),) + tuple(_file_identity(p) for p in self._files(name))
+
+    #put `value` back in the cache as current, for values updated in memory by a write
+    def _keep(self, name, value):
+        with self._cache_lock:
+            self._cache[name] = (self._cache_key(name), value)
+
+    def _cached(self, name, read):
+        key = self._cache_key(name)
+        with self._cache_lock:
+            hit = self._cache.get(name)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        #a miss is a parse (expenses, loans, ...) or a build (ledger, rollups, index, ...)
+        with telemetry.span("load." + name):
+            value = read()
+        with self._cache_lock:
+            self._cache[name] = (key, value)
+        return value
+
+    #call `listener()` after every save of dataset `name`
+    def subscribe(self, name, listener):
+        self._listeners.setdefault(name, []).append(listener)
+
+    def _notify(self, name):
+        for listener in self._listeners.get(name, []):
+            listener()
+
+    def invalidate(self, name):
+        with self._cache_lock:
+            for dataset in (name,) + DEPENDENTS.get(name, ()):
+                self._generation[dataset] = self._generation.get(dataset, 0) + 1
+                self._cache.pop(dataset, None)
+
+    #forget every cached dataset (they are rebuilt on next use), to free the memory of idle tenants
+    def drop_caches(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    #Done with this instance: caches dropped and hooks removed. A call made afterwards
+    #still works, it just reads the files again.
+    def close(self):
+        self.drop_caches()
+
+    #callers get their own copy so adding columns or editing cells never leaks into the cache
+    def load_expenses(self):
+        return self._cached("expenses", self._read_expenses).copy()
+
+    def save_expenses(self, df, base=None):
+        with self.write_lock():
+            df = self._checked_write("expenses", df, base)
+            self._derived_changed()
+        return df
+
+    #Append rows that already carry their "Bank Balance"
+    def append_expenses(self, rows):
+        with self.write_lock():
+            self._store("append", rows)
+            self._expenses_appended()
+            self._derived_changed()
+
+    def _expenses_appended(self):
+        self.invalidate("expenses")
+
+    #the ledger and rollups are rebuilt on next use
+    def _derived_changed(self):
+        self.invalidate("ledger")
+        self.invalidate("rollups")
+
+    #After an append made through post(), keep the ledger and rollups that were updated
+    #in place: the files behind them changed because of this very append
+    def _keep_derived(self, led, totals):
+        self._expenses_appended()
+        with self._cache_lock:
+            self._cache["ledger"] = (self._cache_key("ledger"), led)
+            self._cache["rollups"] = (self._cache_key("rollups"), totals)
+
+    #Running balance engine, built once from the stored rows and then kept up to date by
+    #post(); it is only rebuilt when the expenses change outside of post(). With
+    #EXPENSE_TRACKER_AGGREGATION=stream it is built one chunk at a time, like the rollups.
+    def ledger(self):
+        if streaming_aggregation():
+            return self._cached("ledger", lambda: ledger_engine.Ledger.from_chunks(
+                self.expense_chunks(), self.opening_balance()))
+        return self._cached("ledger", lambda: ledger_engine.Ledger.from_frame(
+            self.load_expenses(), self.opening_balance()))
+
+    #Totals per type/category/day/month and the biggest expenses, maintained the same way
+    #as the ledger. With EXPENSE_TRACKER_AGGREGATION=stream they are built from the
+    #expenses file one chunk at a time and the whole frame is never loaded for them.
+    def rollups(self):
+        if streaming_aggregation():
+            return self._cached("rollups", lambda: Rollups.from_chunks(self.expense_chunks()))
+        return self._cached("rollups", lambda: Rollups.from_frame(self.load_expenses()))
+
+    #The expenses as frames of at most `chunk_rows` rows, in ID order
+    def expense_chunks(self, chunk_rows=CHUNK_ROWS):
+        yield self.load_expenses()
+
+    #Append transactions given as (date, transaction, category, description, amount).
+    #Each row is stored with the running balance after it, so the balance is committed
+    #together with the row. Returns the balance after the last one.
+    def post(self, entries):
+        with self.write_lock():
+            led = self.ledger()
+            totals = self.rollups()
+            try:
+                rows = []
+                for date, transaction, category, description, amount in entries:
+                    balance = led.post(date, transaction, amount)
+                    row_id = int(led.new_ids(1)[0])
+                    totals.add(date, transaction, category, amount, description, row_id)
+                    rows.append([row_id, date_str(date), transaction, category, description, amount, balance])
+                self._store("append", rows)
+            except Exception:
+                self._derived_changed()
+                raise
+            self._keep_derived(led, totals)
+            return led.balance
+
+    #Batch version of post() for imports: `df` has Date, Transaction, Category, Description
+    #and Amount columns; running balances and totals are computed vectorized and the rows
+    #are written with a single append. Returns the balance after the last row.
+    def post_frame(self, df):
+        with self.write_lock():
+            led = self.ledger()
+            totals = self.rollups()
+            try:
+                rows = df.reindex(columns=EXPENSE_COLUMNS).copy()
+                rows["Date"] = [date_str(d) for d in rows["Date"]]
+                rows["Bank Balance"] = led.post_many(rows["Date"], rows["Transaction"], rows["Amount"])
+                rows["ID"] = led.new_ids(len(rows))
+                totals.add_frame(rows)
+                self._store("append", _records(rows, dict(zip(EXPENSE_COLUMNS, EXPENSE_COLUMNS))))
+            except Exception:
+                self._derived_changed()
+                raise
+            self._keep_derived(led, totals)
+            return led.balance
+
+    #Post every autopay payment due up to `today` in one batch and advance each rule's
+    #Next Due, in one transaction. Returns the number of payments; nothing is written
+    #when none are due.
+    def run_autopay(self, today):
+        with telemetry.span("autopay.run"), self.transaction():
+            autopay = self.load_autopay()
+            if autopay.empty:
+                return 0
+            with telemetry.span("autopay.scan", rules=len(autopay)):
+                payments, next_due = autopay_schedule.due_payments(autopay, today)
+            if payments.empty:
+                return 0
+            self.post(zip(payments["Date"], ["Expenditure"] * len(payments), payments["Category"],
+                          payments["Description"], payments["Amount"]))
+            autopay["Next Due"] = next_due
+            self.save_autopay(autopay)
+            return len(payments)
+
+    #Loans and debts indexed by ID and by (counterparty, status)
+    def loan_book(self):
+        return self._cached("loan_book", lambda: loan_book.LoanBook(self._cached("loans", self._read_loans)))
+
+    #Loans/debts of counterparty `to` (optionally only those with `status`)
+    def find_loans(self, to, status=None):
+        return self.loan_book().find(to, status)
+
+    #What every counterparty still owes us and we still owe them, built from the loans once
+    #and then updated in place by register_loan() and settle_loans()
+    def positions(self):
+        return self._cached("positions", lambda: loan_book.Positions.from_frame(
+            self._cached("loans", self._read_loans)))
+
+    #Add a loan ("Loan", money we lent) or a debt ("Debt", money we owe), returns its ID
+    def register_loan(self, date, kind, to, description, amount):
+        if kind not in loan_book.KINDS:
+            raise ValueError(f"Unknown loan type: {kind}")
+        with self.write_lock():
+            book = self.positions()
+            ids = pd.to_numeric(self.loan_book().frame["ID"], errors="coerce")
+            row_id = int(ids.max()) + 1 if ids.notna().any() else 1
+            row = pd.DataFrame([[row_id, date_str(date), kind, to, description, float(amount), loan_book.UNPAID, 0.0]],
+                               columns=LOAN_COLUMNS)
+            self._store("loan_rows", row)
+            self.invalidate("loans")
+            book.add(to, kind, amount)
+            self._keep("positions", book)
+            return row_id
+
+    #Pay back the loans/debts with IDs `ids` in one batch, in full or, with `amounts`, by
+    #that much each (capped at what is still owed). Their ledger entries are posted with one
+    #post_frame() and Paid/Status saved, in one transaction. The IDs are looked up in the
+    #current loans, so rows settled meanwhile by someone else are skipped.
+    #Returns (IDs paid, IDs that were already settled or don't exist).
+    def settle_loans(self, ids, amounts=None):
+        ids = [int(i) for i in ids]
+        asked = None if amounts is None else dict(zip(ids, (float(a) for a in amounts)))
+        with self.write_lock():
+            book = self.positions()
+            with self.transaction():
+                settle = loan_book.open_rows(self.loan_book().rows(ids))
+                owed = loan_book.outstanding(settle)
+                pay = owed if asked is None else np.minimum(owed, settle["ID"].map(asked).clip(lower=0.0))
+                settle, pay = settle[pay > 0], pay[pay > 0]
+                settled = settle["ID"].tolist()
+                skipped = [i for i in ids if i not in set(settled)]
+                if not settle.empty:
+                    self.post_frame(loan_book.settlement_entries(settle, pay))
+                    #only the paid rows are written
+                    rows = settle.reindex(columns=LOAN_COLUMNS)
+                    rows["Paid"] = pd.to_numeric(rows["Paid"], errors="coerce").fillna(0.0) + pay
+                    amount = pd.to_numeric(rows["Amount"], errors="coerce").fillna(0.0)
+                    rows["Status"] = np.where(rows["Paid"] >= amount - 0.005, loan_book.SETTLED, loan_book.PARTIAL)
+                    self._store("loan_rows", rows)
+                    self.invalidate("loans")
+                    book.add_frame(settle["To"], settle["Transaction"], -pay)
+            self._keep("positions", book)
+            return settled, skipped
+
+    #Sorted views of a stored dataset ("expenses", "loans" or "autopay") for paging, one per
+    #sort column, plus the view of the filter last paged with; dropped on every write
+    def _page_views(self, name):
+        return self._cached(name + "_pages", dict)
+
+    def _sorted_view(self, name, column):
+        views = self._page_views(name)
+        if column not in views:
+            read = {"expenses": self._read_expenses, "loans": self._read_loans, "autopay": self._read_autopay}[name]
+            views[column] = paging.SortedView(self._cached(name, read), column)
+        return views[column]
+
+    #rows written to `name` that are not in its cached frame yet (the expenses log), or None
+    def _pending(self, name):
+        return None
+
+    #The sorted view of the expenses cut down to the rows matching the filters. The rows
+    #are found through the expense index (the date range by binary search, categories and
+    #types by their codes) and the view is kept, so every page after the first is a binary
+    #search. The index and the view are built from the same cached frame.
+    def _filtered_view(self, name, sort, filters):
+        view = self._sorted_view(name, sort)
+        if not any(filters):
+            return view
+        views = self._page_views(name)
+        signature = ("filtered", sort, repr(filters))
+        if signature not in views:
+            mask = np.zeros(len(view.frame), dtype=bool)
+            mask[self.expense_index().positions(*filters)] = True
+            #only the last filter's view is kept
+            for stale in [k for k in views if isinstance(k, tuple)]:
+                del views[stale]
+            views[signature] = view.subset(mask)
+        return views[signature]
+
+    #One page of a dataset ("expenses", "loans" or "autopay") in (`sort`, ID) order, after
+    #cursor `after` or before cursor `before` (from an earlier Page's next / prev). Expenses
+    #take the same filters as query_expenses(). Returns a paging.Page.
+    def page(self, name, sort="ID", descending=False, after=None, before=None, limit=paging.PAGE_SIZE,
+             start=None, end=None, categories=None, transactions=None, month=None):
+        filters = (start, end, categories or None, transactions or None, month)
+        if any(filters) and name != "expenses":
+            raise ValueError(f"Only expenses can be filtered, not {name}")
+        with self._reading(name):
+            views = [(self._filtered_view(name, sort, filters), None)]
+            pending = self._pending(name)
+        if pending is not None and len(pending):
+            #the few rows still in the log are masked directly
+            mask = _expense_mask(pending, *filters).to_numpy() if any(filters) else None
+            views.append((paging.SortedView(pending, sort), mask))
+        return paging.page(views, after, before, limit, descending)
+
+    #held while a dataset and its pending rows are read together
+    def _reading(self, name):
+        return contextlib.nullcontext()
+
+    def balance_as_of(self, date):
+        return self.ledger().balance_as_of(date)
+
+    def load_loans(self):
+        return self._cached("loans", self._read_loans).copy()
+
+    def save_loans(self, df, base=None):
+        return self._checked_write("loans", df, base)
+
+    def load_autopay(self):
+        return self._cached("autopay", self._read_autopay).copy()
+
+    def save_autopay(self, df, base=None):
+        df = self._checked_write("autopay", df, base)
+        self._notify("autopay")
+        return df
+
+    #The current balance is the running balance on the last stored row
+    def load_balance(self):
+        return self.ledger().balance
+
+    #balance.csv / the balance table only hold the balance entered before the first
+    #transaction, it is never rewritten when transactions are added
+    def opening_balance(self):
+        return self._cached("balance", self._read_balance)
+
+    def save_balance(self, balance):
+        with self.write_lock():
+            self._store("balance", balance)
+            self.invalidate("balance")
+            self.invalidate("ledger")
+
+    def has_balance(self):
+        raise NotImplementedError
+
+    #Date-sorted index over the stored expenses, rebuilt only when they change
+    def expense_index(self):
+        return self._cached("expense_index",
+                            lambda: ExpenseIndex(self._cached("expenses", self._read_expenses)))
+
+    #(index, rows not covered by it yet); the CSV backend leaves its pending log rows out
+    def _indexed_expenses(self):
+        return self.expense_index(), None
+
+    #Expenses matching the filters, any filter left as None is not applied
+    def query_expenses(self, start=None, end=None, categories=None, transactions=None, month=None):
+        index, extra = self._indexed_expenses()
+        result = index.query(start, end, categories, transactions, month)
+        if extra is not None and len(extra):
+            extra = extra[_expense_mask(extra, start, end, categories, transactions, month)]
+            result = pd.concat([result, extra])
+        return result
+
+    #Sum of Amount per transaction type, e.g. {"Expenditure": 120.0, "Income": 500.0}
+    def totals_by_transaction(self, start=None, end=None, categories=None, transactions=None, month=None):
+        df = self.query_expenses(start, end, categories, transactions, month)
+        return df.groupby("Transaction")["Amount"].sum().to_dict()
+
+    def distinct(self, column):
+        index, extra = self._indexed_expenses()
+        values = index.distinct(column)
+        if extra is not None and len(extra):
+            values += [v for v in extra[column].dropna().unique().tolist() if v not in values]
+        return values
+
+    #(first date, last date) in the expenses, or (None, None) when there are none
+    def date_bounds(self):
+        index, extra = self._indexed_expenses()
+        bounds = [d for d in index.date_bounds() if d is not None]
+        if extra is not None and len(extra):
+            dates = pd.to_datetime(extra["Date"], errors="coerce").dropna()
+            bounds += [d.date() for d in dates]
+        if not bounds:
+            return None, None
+        return min(bounds), max(bounds)
+
+
+def _expense_mask(df, start, end, categories, transactions, month):
+    mask = pd.Series(True, index=df.index)
+    if start is not None or end is not None or month is not None:
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        if start is not None:
+            mask &= dates >= pd.Timestamp(start)
+        if end is not None:
+            mask &= dates <= pd.Timestamp(end)
+        if month is not None:
+            mask &= dates.dt.month == month
+    if categories:
+        mask &= df["Category"].isin(categories)
+    if transactions:
+        mask &= df["Transaction"].isin(transactions)
+    return mask
+
+
+# --- Backends whose expenses file gets appends through transaction_log ---
+# Subclasses set filepath, balancefile, loans_and_debts and autopay_file.
+class LogBackend(Backend):
+
+    def __init__(self):
+        super().__init__()
+        self._carried_over = {}
+        self._journal = None
+        transaction_log.on_compaction(self.filepath, self._compaction)
+        self._add_ids()
+
+    #Files written before rows had IDs (or loans had "Paid") get the missing columns once,
+    #when the backend is opened
+    def _add_ids(self):
+        with self.write_lock():
+            logged = transaction_log.log_columns(self.filepath)
+            old_log = logged is not None and "ID" not in logged
+            if old_log:
+                #fold rows logged without IDs into the file first, in the file's own layout
+                transaction_log.compact(self.filepath)
+            for path, load, save, columns in (
+                    (self.filepath, self.load_expenses, self.save_expenses, EXPENSE_COLUMNS),
+                    (self.loans_and_debts, self.load_loans, self.save_loans, LOAN_COLUMNS),
+                    (self.autopay_file, self.load_autopay, self.save_autopay, AUTOPAY_COLUMNS)):
+                if os.path.exists(path) and (old_log and path == self.filepath or
+                                             not set(columns) <= set(self._stored_columns(path))):
+                    save(load())
+
+    def _files(self, name):
+        return {"expenses": [self.filepath], "expense_index": [self.filepath],
+                "ledger": [self.filepath, transaction_log.log_path(self.filepath), self.balancefile],
+                "rollups": [self.filepath, transaction_log.log_path(self.filepath)],
+                "loans": [self.loans_and_debts], "loan_book": [self.loans_and_debts],
+                "positions": [self.loans_and_debts], "expenses_pages": [self.filepath],
+                "loans_pages": [self.loans_and_debts], "autopay_pages": [self.autopay_file],
+                "autopay": [self.autopay_file], "balance": [self.balancefile]}[name]
+
+    def _lock_path(self):
+        return self.filepath + ".lock"
+
+    def close(self):
+        transaction_log.remove_compaction_hook(self.filepath, self._compaction)
+        super().close()
+
+    #appends only change the log, so it is part of the expenses version
+    def version(self, name):
+        if name == "expenses":
+            return (_file_identity(self.filepath), _file_identity(transaction_log.log_path(self.filepath)))
+        return super().version(name)
+
+    #rows read back from the log, as a frame shaped like the stored expenses
+    def _pending_frame(self, pending, start=0):
+        frame = pd.DataFrame(pending, columns=EXPENSE_COLUMNS)
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        return frame
+
+    #an empty file frame has object columns, concat would turn the logged numbers into objects
+    def _combine(self, base, pending):
+        return pd.concat([base, pending]) if len(base) else pending
+
+    #The parsed expenses file is cached, the rows appended to its log since the last
+    #compaction are read fresh (the log is small) so an append never forces a reparse
+    def load_expenses(self):
+        with transaction_log.locked(self.filepath):
+            df = self._cached("expenses", self._read_expenses)
+            pending = transaction_log.pending_rows(self.filepath)
+        if pending:
+            return self._combine(df, self._pending_frame(pending, len(df))).reset_index(drop=True)
+        return df.copy()
+
+    #the index covers the expenses file, the few rows still in the log are filtered directly
+    def _indexed_expenses(self):
+        with transaction_log.locked(self.filepath):
+            index = self.expense_index()
+            pending = transaction_log.pending_rows(self.filepath)
+        if not pending:
+            return index, None
+        return index, self._pending_frame(pending, len(index))
+
+    def _reading(self, name):
+        return transaction_log.locked(self.filepath) if name == "expenses" else contextlib.nullcontext()
+
+    #rows still in the log are paged from a small view of their own, merged in by paging.page
+    def _pending(self, name):
+        if name != "expenses":
+            return None
+        pending = transaction_log.pending_rows(self.filepath)
+        if not pending:
+            return None
+        return self._pending_frame(pending, len(self._cached("expenses", self._read_expenses)))
+
+    #The file is read chunk by chunk unless it is parsed and cached already, then come the
+    #log rows. The log lock is held throughout so a compaction can't move rows in between.
+    def expense_chunks(self, chunk_rows=CHUNK_ROWS):
+        with transaction_log.locked(self.filepath):
+            key = self._cache_key("expenses")
+            with self._cache_lock:
+                hit = self._cache.get("expenses")
+            if hit is not None and hit[0] == key:
+                chunks = [hit[1]]
+            elif os.path.exists(self.filepath):
+                chunks = self._read_expense_chunks(chunk_rows)
+            else:
+                chunks = []
+            count = 0
+            for chunk in chunks:
+                count += len(chunk)
+                yield chunk
+            pending = transaction_log.pending_rows(self.filepath)
+            if pending:
+                yield self._pending_frame(pending, count)
+
+    #appends only touch the log, which load_expenses reads fresh anyway
+    def _expenses_appended(self):
+        pass
+
+    #A compaction moves the log rows into the expenses file without changing the data, so
+    #the ledger, rollups and parsed frame that were current before it stay valid after it
+    def _compaction(self, stage):
+        if stage == "before":
+            self._carried_over = {}
+            for name in ("expenses", "ledger", "rollups"):
+                key = self._cache_key(name)
+                with self._cache_lock:
+                    hit = self._cache.get(name)
+                if hit is not None and hit[0] == key:
+                    self._carried_over[name] = hit[1]
+            if "expenses" in self._carried_over:
+                pending = transaction_log.pending_rows(self.filepath)
+                if pending:
+                    base = self._carried_over["expenses"]
+                    self._carried_over["expenses"] = self._combine(base, self._pending_frame(pending, len(base)))
+        else:
+            with self._cache_lock:
+                for name, value in self._carried_over.items():
+                    self._cache[name] = (self._cache_key(name), value)
+            self._carried_over = {}
+
+    def _append_expenses(self, rows):
+        transaction_log.append_many(self.filepath, rows, EXPENSE_COLUMNS)
+
+    def expense_count(self):
+        with transaction_log.locked(self.filepath):
+            return len(self._cached("expenses", self._read_expenses)) + len(transaction_log.pending_rows(self.filepath))
+
+    # --- Transactions ---
+    # The writes made inside transaction() are held back and committed together: first the
+    # whole set is written to a journal file (fsync + rename, the commit point), then each
+    # write is applied, then the journal is removed. If the process dies after the commit
+    # point, the next writer replays the journal. Every step is idempotent: files are
+    # replaced whole, and the expenses append is skipped when the rows are already there
+    # (the row count it was made against is in the journal). Single writes outside a
+    # transaction don't use the journal and cost nothing extra.
+    def _journal_path(self):
+        return self.filepath + ".journal"
+
+    def _store(self, name, value):
+        if self._journal is None:
+            return super()._store(name, value)
+        if name == "expenses":
+            raise RuntimeError("save_expenses() can't be part of a transaction")
+        if name == "append":
+            self._journal.setdefault("count", self.expense_count())
+            self._journal.setdefault("append", []).extend(list(row) for row in value)
+        elif name == "loan_rows" and "loan_rows" in self._journal:
+            self._journal[name] = pd.concat([self._journal[name], value], ignore_index=True)
+        else:
+            self._journal[name] = value
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.write_lock():
+            if self._journal is not None:
+                #nested blocks are part of the outer transaction
+                yield
+                return
+            self._journal = {}
+            try:
+                yield
+                journal = self._journal
+            except BaseException:
+                self._rolled_back()
+                raise
+            finally:
+                self._journal = None
+            if journal:
+                self._commit(journal)
+
+    def _commit(self, journal):
+        record = dict(journal)
+        for name in ("loans", "loan_rows", "autopay"):
+            if name in record:
+                df = record[name]
+                record[name] = {"columns": list(df.columns), "rows": _records(df, dict(zip(df.columns, df.columns)))}
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(record, f, default=_json_value)
+
+        with telemetry.span("save.commit", writes=sorted(journal)):
+            replace_file(self._journal_path(), write)
+            #the ledger and rollups were updated in memory when the rows were posted
+            self._keeping_cache(lambda: self._apply(record))
+            os.remove(self._journal_path())
+            transaction_log._fsync_dir(self._journal_path())
+        for name in ("loans", "autopay", "balance"):
+            if name in record:
+                self.invalidate(name)
+        if "loan_rows" in record:
+            self.invalidate("loans")
+        if "balance" in record:
+            self.invalidate("ledger")
+        if "autopay" in record:
+            self._notify("autopay")
+
+    def _apply(self, record):
+        if "append" in record and self.expense_count() == record["count"]:
+            self._append_expenses(record["append"])
+        if "loans" in record:
+            self._write_loans(pd.DataFrame(record["loans"]["rows"], columns=record["loans"]["columns"]))
+        if "loan_rows" in record:
+            self._write_loan_rows(pd.DataFrame(record["loan_rows"]["rows"], columns=record["loan_rows"]["columns"]))
+        if "autopay" in record:
+            self._write_autopay(pd.DataFrame(record["autopay"]["rows"], columns=record["autopay"]["columns"]))
+        if "balance" in record:
+            self._write_balance(record["balance"])
+
+    #finish a transaction whose commit was cut short by a crash
+    def _recover(self):
+        if not os.path.exists(self._journal_path()):
+            return
+        with open(self._journal_path(), encoding="utf-8") as f:
+            record = json.load(f)
+        self._apply(record)
+        os.remove(self._journal_path())
+        transaction_log._fsync_dir(self._journal_path())
+        self._rolled_back()
+
+
+# --- CSV backend (the original file layout) ---
+class CSVBackend(LogBackend):
+
+    def __init__(self, folder="."):
+        self.folder = folder
+        self.filepath = os.path.join(folder, "expenses.csv")
+        self.balancefile = os.path.join(folder, "balance.csv")
+        self.loans_and_debts = os.path.join(folder, "loans_and_debts.csv")
+        self.autopay_file = os.path.join(folder, "autopay.csv")
+        super().__init__()
+
+    def _stored_columns(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), [])
+
+    def _read_expenses(self):
+        if os.path.exists(self.filepath):
+            return pd.read_csv(self.filepath)
+        return pd.DataFrame(columns=EXPENSE_COLUMNS)
+
+    def _read_expense_chunks(self, chunk_rows):
+        with pd.read_csv(self.filepath, chunksize=chunk_rows) as reader:
+            yield from reader
+
+    def _write_expenses(self, df):
+        transaction_log.rewrite(self.filepath, lambda tmp: df.to_csv(tmp, index=False))
+
+    def _read_loans(self):
+        if os.path.exists(self.loans_and_debts):
+            return pd.read_csv(self.loans_and_debts)
+        return pd.DataFrame(columns=LOAN_COLUMNS)
+
+    def _write_loans(self, df):
+        replace_file(self.loans_and_debts, lambda tmp: df.to_csv(tmp, index=False))
+
+    def _read_autopay(self):
+        if os.path.exists(self.autopay_file):
+            return pd.read_csv(self.autopay_file)
+        return pd.DataFrame(columns=AUTOPAY_COLUMNS)
+
+    def _write_autopay(self, df):
+        replace_file(self.autopay_file, lambda tmp: df.to_csv(tmp, index=False))
+
+    def has_balance(self):
+        return os.path.exists(self.balancefile)
+
+    def _read_balance(self):
+        if os.path.exists(self.balancefile):
+            return pd.read_csv(self.balancefile).iloc[0,0]
+        return DEFAULT_BALANCE
+
+    def _write_balance(self, balance):
+        replace_file(self.balancefile, lambda tmp: pd.DataFrame([{"Balance": balance}]).to_csv(tmp, index=False))
+
+
+# --- SQLite backend ---
+# app column -> sql column, per table
+EXPENSE_SQL = {"ID": "id", "Date": "date", "Transaction": "txn", "Category": "category",
+               "Description": "description", "Amount": "amount", "Bank Balance": "bank_balance"}
+LOAN_SQL = {"ID": "id", "Date": "date", "Transaction": "txn", "To": "counterparty",
+            "Description": "description", "Amount": "amount", "Status": "status", "Paid": "paid"}
+AUTOPAY_SQL = {"ID": "id", "Start Date": "start_date", "Transaction": "txn", "Category": "category",
+               "Description": "description", "Amount": "amount", "Frequency": "frequency",
+               "Next Due": "next_due"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    txn TEXT NOT NULL,
+    category TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    bank_balance REAL
+);
+CREATE INDEX IF NOT EXISTS expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS expenses_txn_date ON expenses(txn, date);
+CREATE INDEX IF NOT EXISTS expenses_category_date ON expenses(category, date);
+
+CREATE TABLE IF NOT EXISTS loans (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    txn TEXT NOT NULL,
+    counterparty TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    status TEXT,
+    paid REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS loans_counterparty_status ON loans(counterparty, status);
+
+CREATE TABLE IF NOT EXISTS autopay (
+    id INTEGER PRIMARY KEY,
+    start_date TEXT,
+    txn TEXT,
+    category TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    frequency TEXT,
+    next_due TEXT
+);
+CREATE INDEX IF NOT EXISTS autopay_next_due ON autopay(next_due);
+
+CREATE TABLE IF NOT EXISTS balance (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    balance REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+    dataset TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def _select(table, mapping, extra=()):
+    cols = ", ".join([f'{sql} AS "{app}"' for app, sql in mapping.items()] + list(extra))
+    return f"SELECT {cols} FROM {table}"
+
+
+#numpy scalars and timestamps in journal records
+def _json_value(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _records(df, mapping):
+    #NaN -> NULL, numpy scalars -> python values (astype(object) converts them)
+    df = df.reindex(columns=list(mapping)).astype(object)
+    return df.where(df.notna(), None).to_numpy().tolist()
+
+
+def _insert(table, mapping):
+    cols = ", ".join(mapping.values())
+    marks = ", ".join("?" * len(mapping))
+    return f"INSERT INTO {table} ({cols}) VALUES ({marks})"
+
+
+#insert, or update every column of the row with the same id
+def _upsert(table, mapping):
+    updates = ", ".join(f"{sql} = excluded.{sql}" for sql in mapping.values() if sql != "id")
+    return f"{_insert(table, mapping)} ON CONFLICT(id) DO UPDATE SET {updates}"
+
+
+def _expense_where(start, end, categories, transactions, month):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("date >= ?")
+        params.append(date_str(start))
+    if end is not None:
+        clauses.append("date <= ?")
+        params.append(date_str(end))
+    if categories:
+        clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if transactions:
+        clauses.append(f"txn IN ({', '.join('?' * len(transactions))})")
+        params.extend(transactions)
+    if month is not None:
+        clauses.append("CAST(strftime('%m', date) AS INTEGER) = ?")
+        params.append(int(month))
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+
+class SQLiteBackend(Backend):
+
+    def __init__(self, path="expenses.db"):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            #databases created before loans kept what was paid back
+            if "paid" not in [row[1] for row in conn.execute("PRAGMA table_info(loans)")]:
+                conn.execute("ALTER TABLE loans ADD COLUMN paid REAL NOT NULL DEFAULT 0")
+
+    #one connection per thread, Streamlit runs every session on its own thread
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    #connection to write with: commits on exit, unless a transaction() is open
+    @contextlib.contextmanager
+    def _writing(self):
+        conn = self._conn()
+        if getattr(self._local, "in_transaction", False):
+            yield conn
+        else:
+            with conn:
+                yield conn
+
+    #a native SQLite transaction around the block
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.write_lock():
+            if getattr(self._local, "in_transaction", False):
+                yield
+                return
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.in_transaction = True
+            try:
+                yield
+            except BaseException:
+                self._local.in_transaction = False
+                conn.rollback()
+                self._rolled_back()
+                raise
+            self._local.in_transaction = False
+            #the ledger and rollups were updated in memory when the rows were posted
+            with telemetry.span("save.commit"):
+                self._keeping_cache(conn.commit)
+
+    #each table is the dataset of the same name
+    def _replace(self, conn, table, mapping, df):
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(_insert(table, mapping), _records(df, mapping))
+        self._bump(conn, table)
+
+    #A cached value is current while the counters of the datasets it is built from are
+    #unchanged. Every write bumps only its own dataset's counter, in its own transaction,
+    #so commits from other processes are seen and e.g. an autopay save keeps the ledger.
+    def _cache_key(self, name):
+        versions = dict(self._conn().execute("SELECT dataset, version FROM versions").fetchall())
+        return (self._generation.get(name, 0),) + tuple(versions.get(dataset, 0) for dataset in SOURCES[name])
+
+    def _lock_path(self):
+        return self.path + ".lock"
+
+    #every write bumps its dataset's counter in the same transaction
+    def _bump(self, conn, name):
+        conn.execute("INSERT INTO versions (dataset, version) VALUES (?, 1) "
+                     "ON CONFLICT(dataset) DO UPDATE SET version = version + 1", (name,))
+
+    def version(self, name):
+        row = self._conn().execute("SELECT version FROM versions WHERE dataset = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _read_expenses(self):
+        return pd.read_sql_query(_select("expenses", EXPENSE_SQL) + " ORDER BY id", self._conn())
+
+    def expense_chunks(self, chunk_rows=CHUNK_ROWS):
+        yield from pd.read_sql_query(_select("expenses", EXPENSE_SQL) + " ORDER BY id", self._conn(),
+                                     chunksize=chunk_rows)
+
+    def _write_expenses(self, df):
+        with self._writing() as conn:
+            self._replace(conn, "expenses", EXPENSE_SQL, df)
+
+    def _append_expenses(self, rows):
+        df = pd.DataFrame(rows, columns=EXPENSE_COLUMNS)
+        with self._writing() as conn:
+            conn.executemany(_insert("expenses", EXPENSE_SQL), _records(df, EXPENSE_SQL))
+            self._bump(conn, "expenses")
+
+    def _read_loans(self):
+        return pd.read_sql_query(_select("loans", LOAN_SQL) + " ORDER BY id", self._conn())
+
+    def _write_loans(self, df):
+        with self._writing() as conn:
+            self._replace(conn, "loans", LOAN_SQL, df)
+
+    def _write_loan_rows(self, rows):
+        with self._writing() as conn:
+            conn.executemany(_upsert("loans", LOAN_SQL), _records(rows, LOAN_SQL))
+            self._bump(conn, "loans")
+
+    def _read_autopay(self):
+        return pd.read_sql_query(_select("autopay", AUTOPAY_SQL) + " ORDER BY id", self._conn())
+
+    def _write_autopay(self, df):
+        with self._writing() as conn:
+            self._replace(conn, "autopay", AUTOPAY_SQL, df)
+
+    def has_balance(self):
+        return self._conn().execute("SELECT 1 FROM balance WHERE id = 1").fetchone() is not None
+
+    def _read_balance(self):
+        row = self._conn().execute("SELECT balance FROM balance WHERE id = 1").fetchone()
+        return row[0] if row else DEFAULT_BALANCE
+
+    def _write_balance(self, balance):
+        with self._writing() as conn:
+            conn.execute("INSERT OR REPLACE INTO balance (id, balance) VALUES (1, ?)", (float(balance),))
+            self._bump(conn, "balance")
+
+    #Keyset paging in SQL: WHERE (key, id) > (cursor) ORDER BY key, id LIMIT n, which walks
+    #the (date, id) index of expenses instead of skipping rows like OFFSET
+    def page(self, name, sort="ID", descending=False, after=None, before=None, limit=paging.PAGE_SIZE,
+             start=None, end=None, categories=None, transactions=None, month=None):
+        mapping = {"expenses": EXPENSE_SQL, "loans": LOAN_SQL, "autopay": AUTOPAY_SQL}[name]
+        if name == "expenses":
+            where, params = _expense_where(start, end, categories, transactions, month)
+        elif any((start, end, categories, transactions, month)):
+            raise ValueError(f"Only expenses can be filtered, not {name}")
+        else:
+            where, params = "", []
+        column = mapping[sort]
+        #nullable columns sort as "" so a cursor on a missing value still compares
+        key = column if column in self._not_null(name) else f"IFNULL({column}, '')"
+        cursor = after if after is not None else before
+        forward = (before is None) != descending
+        if cursor is not None:
+            where += (" AND " if where else " WHERE ") + f"({key}, id) {'>' if forward else '<'} (?, ?)"
+            params = params + list(cursor)
+        direction = "ASC" if forward else "DESC"
+        sql = (f"{_select(name, mapping, [f'{key} AS _key'])}{where} "
+               f"ORDER BY {key} {direction}, id {direction} LIMIT ?")
+        rows = pd.read_sql_query(sql, self._conn(), params=params + [limit + 1])
+        more = len(rows) > limit
+        rows = rows.iloc[:limit]
+        if forward == descending:
+            rows = rows.iloc[::-1]
+        keys = rows.pop("_key").tolist()
+        ids = rows["ID"].tolist()
+        first, last = ((keys[0], ids[0]), (keys[-1], ids[-1])) if ids else (None, None)
+        return paging.make_page(rows.reset_index(drop=True), first, last, more, cursor is not None,
+                                before is not None)
+
+    def _not_null(self, table):
+        return {row[1] for row in self._conn().execute(f"PRAGMA table_info({table})") if row[3] or row[5]}
+
+    def query_expenses(self, start=None, end=None, categories=None, transactions=None, month=None):
+        where, params = _expense_where(start, end, categories, transactions, month)
+        sql = _select("expenses", EXPENSE_SQL) + where + " ORDER BY id"
+        return pd.read_sql_query(sql, self._conn(), params=params)
+
+    def totals_by_transaction(self, start=None, end=None, categories=None, transactions=None, month=None):
+        where, params = _expense_where(start, end, categories, transactions, month)
+        rows = self._conn().execute(f"SELECT txn, SUM(amount) FROM expenses{where} GROUP BY txn", params)
+        return dict(rows.fetchall())
+
+    def distinct(self, column):
+        sql_column = EXPENSE_SQL[column]
+        rows = self._conn().execute(
+            f"SELECT DISTINCT {sql_column} FROM expenses WHERE {sql_column} IS NOT NULL")
+        return [r[0] for r in rows.fetchall()]
+
+    def date_bounds(self):
+        first, last = self._conn().execute("SELECT MIN(date), MAX(date) FROM expenses").fetchone()
+        if first is None:
+            return None, None
+        return pd.Timestamp(first).date(), pd.Timestamp(last).date()
+
+    def is_empty(self):
+        conn = self._conn()
+        return all(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+                   for table in ("expenses", "loans", "autopay", "balance"))
+
+
+# --- Columnar backend (Parquet or Arrow IPC, needs the optional pyarrow package) ---
+# Every file has a fixed typed schema: real datetime64 dates, categorical columns for the
+# few repeated values, float64 amounts. Loads skip CSV parsing and dtype inference; Arrow
+# IPC files are written uncompressed and memory-mapped, so loading them is close to zero-copy.
+EXPENSE_TYPES = {"ID": "int", "Date": "datetime", "Transaction": "category", "Category": "category",
+                 "Description": "text", "Amount": "float", "Bank Balance": "float"}
+LOAN_TYPES = {"ID": "int", "Date": "datetime", "Transaction": "category", "To": "text",
+              "Description": "text", "Amount": "float", "Status": "category", "Paid": "float"}
+AUTOPAY_TYPES = {"ID": "int", "Start Date": "datetime", "Transaction": "category", "Category": "category",
+                 "Description": "text", "Amount": "float", "Frequency": "category",
+                 "Next Due": "datetime"}
+
+
+#Cast `df` to a schema above, columns outside the schema are dropped
+def typed(df, types):
+    columns = {}
+    for column, kind in types.items():
+        values = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if kind == "datetime":
+            columns[column] = pd.to_datetime(values, errors="coerce")
+        elif kind == "category":
+            columns[column] = values.astype(object).where(values.notna(), None).astype("category")
+        elif kind == "int":
+            #nullable, so rows from before IDs existed still show up as missing
+            columns[column] = pd.to_numeric(values, errors="coerce").astype("Int64")
+        elif kind == "float":
+            columns[column] = pd.to_numeric(values, errors="coerce").astype("float64")
+        else:
+            columns[column] = values.astype(object).where(values.notna(), None)
+    return pd.DataFrame(columns, index=df.index)
+
+
+class ColumnarBackend(LogBackend):
+
+    def __init__(self, folder=".", fmt="parquet"):
+        try:
+            import pyarrow
+            import pyarrow.feather
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet/arrow storage backend needs pyarrow: pip install pyarrow") from None
+        if fmt not in ("parquet", "arrow"):
+            raise ValueError(f"Unknown columnar format: {fmt}")
+        self.pa = pyarrow
+        self.fmt = fmt
+        self.folder = folder
+        self.filepath = os.path.join(folder, f"expenses.{fmt}")
+        self.balancefile = os.path.join(folder, f"balance.{fmt}")
+        self.loans_and_debts = os.path.join(folder, f"loans_and_debts.{fmt}")
+        self.autopay_file = os.path.join(folder, f"autopay.{fmt}")
+        #these files can't be appended to, compaction rewrites them with the log rows added
+        transaction_log.set_folder(self.filepath, self._fold)
+        super().__init__()
+
+    def _read(self, path, types):
+        if not os.path.exists(path):
+            return typed(pd.DataFrame(columns=list(types)), types)
+        if self.fmt == "parquet":
+            table = self.pa.parquet.read_table(path, memory_map=True)
+        else:
+            table = self.pa.feather.read_table(path, memory_map=True)
+        return table.to_pandas()
+
+    def _write_to(self, df, path, types):
+        table = self.pa.Table.from_pandas(typed(df, types), preserve_index=False)
+        if self.fmt == "parquet":
+            self.pa.parquet.write_table(table, path)
+        else:
+            self.pa.feather.write_feather(table, path, compression="uncompressed")
+
+    def _write(self, df, path, types):
+        replace_file(path, lambda tmp: self._write_to(df, tmp, types))
+
+    def _stored_columns(self, path):
+        if self.fmt == "parquet":
+            return self.pa.parquet.read_schema(path).names
+        with self.pa.memory_map(path) as source:
+            return self.pa.ipc.open_file(source).schema.names
+
+    def _fold(self, path, rows, columns):
+        base = self._read(path, EXPENSE_TYPES)
+        self._write(pd.concat([base, typed(pd.DataFrame(rows, columns=columns), EXPENSE_TYPES)]),
+                    path, EXPENSE_TYPES)
+
+    def _pending_frame(self, pending, start=0):
+        return typed(super()._pending_frame(pending, start), EXPENSE_TYPES)
+
+    #concat turns categoricals with different categories into objects, cast back
+    def _combine(self, base, pending):
+        return typed(pd.concat([base, pending]), EXPENSE_TYPES)
+
+    def _read_expenses(self):
+        return self._read(self.filepath, EXPENSE_TYPES)
+
+    #record batches of the memory-mapped file (Arrow files keep the batches they were written in)
+    def _read_expense_chunks(self, chunk_rows):
+        if self.fmt == "parquet":
+            batches = self.pa.parquet.ParquetFile(self.filepath, memory_map=True).iter_batches(chunk_rows)
+            for batch in batches:
+                yield batch.to_pandas()
+        else:
+            reader = self.pa.ipc.open_file(self.pa.memory_map(self.filepath))
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+
+    def _write_expenses(self, df):
+        transaction_log.rewrite(self.filepath, lambda tmp: self._write_to(df, tmp, EXPENSE_TYPES))
+
+    #loans and autopay are edited in place by the app (Status set to "Settled" and so on),
+    #so they are handed out with plain object columns instead of fixed categories
+    def _editable(self, df):
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def _read_loans(self):
+        return self._editable(self._read(self.loans_and_debts, LOAN_TYPES))
+
+    def _write_loans(self, df):
+        self._write(df, self.loans_and_debts, LOAN_TYPES)
+
+    def _read_autopay(self):
+        return self._editable(self._read(self.autopay_file, AUTOPAY_TYPES))
+
+    def _write_autopay(self, df):
+        self._write(df, self.autopay_file, AUTOPAY_TYPES)
+
+    def has_balance(self):
+        return os.path.exists(self.balancefile)
+
+    def _read_balance(self):
+        if os.path.exists(self.balancefile):
+            return float(self._read(self.balancefile, {"Balance": "float"}).iloc[0, 0])
+        return DEFAULT_BALANCE
+
+    def _write_balance(self, balance):
+        self._write(pd.DataFrame([{"Balance": balance}]), self.balancefile, {"Balance": "float"})
+
+
+#Copy everything from one backend into another (e.g. CSV -> Parquet)
+def copy_data(source, target):
+    expenses = source.load_expenses()
+    loans = source.load_loans()
+    autopay = source.load_autopay()
+    target.save_expenses(expenses)
+    target.save_loans(loans)
+    target.save_autopay(autopay)
+    if source.has_balance():
+        target.save_balance(source.opening_balance())
+    return {"expenses": len(expenses), "loans": len(loans), "autopay": len(autopay)}
+
+
+#One-shot import of the CSV files in `folder` into a new SQLite database
+def migrate_csv_to_sqlite(folder=".", db_path="expenses.db"):
+    source = CSVBackend(folder)
+    target = SQLiteBackend(db_path)
+    if not target.is_empty():
+        raise ValueError(f"{db_path} already has data, refusing to import over it")
+    expenses = source.load_expenses()
+    loans = source.load_loans()
+    autopay = source.load_autopay()
+    with target._conn() as conn:
+        target._replace(conn, "expenses", EXPENSE_SQL, expenses)
+        target._replace(conn, "loans", LOAN_SQL, loans)
+        target._replace(conn, "autopay", AUTOPAY_SQL, autopay)
+        if source.has_balance():
+            conn.execute("INSERT INTO balance (id, balance) VALUES (1, ?)",
+                         (float(source.opening_balance()),))
+    return {"expenses": len(expenses), "loans": len(loans), "autopay": len(autopay)}
+
+
+#A backend of type `kind` keeping its files in `folder` (SQLite: `db_path`, by default
+#expenses.db inside `folder`)
+def open_backend(kind, folder=".", db_path=None):
+    if kind == "csv":
+        return CSVBackend(folder)
+    if kind == "sqlite":
+        return SQLiteBackend(db_path or os.path.join(folder, "expenses.db"))
+    if kind in ("parquet", "arrow"):
+        return ColumnarBackend(folder, kind)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def backend_kind():
+    return os.environ.get("EXPENSE_TRACKER_BACKEND", "csv").lower()
+
+
+#EXPENSE_TRACKER_AGGREGATION=stream builds the rollups chunk by chunk (memory by default)
+def streaming_aggregation():
+    return os.environ.get("EXPENSE_TRACKER_AGGREGATION", "memory").lower() == "stream"
+
+
+#The backend the settings point at: EXPENSE_TRACKER_BACKEND=csv|sqlite|parquet|arrow (csv by
+#default), the EXPENSE_TRACKER_DATA folder (default .) and for sqlite EXPENSE_TRACKER_DB
+#(default expenses.db in that folder). Arguments given here override the variables.
+def configured_backend(kind=None, folder=None, db_path=None):
+    folder = folder or os.environ.get("EXPENSE_TRACKER_DATA", ".")
+    return open_backend(kind or backend_kind(), folder, db_path or os.environ.get("EXPENSE_TRACKER_DB"))
+
+
+#The app's backend, opened once
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = configured_backend()
+    return _backend
+
+
+if __name__ == "__main__":
+    #python -m expense_tracker.storage migrate [csv folder] [database file]
+    #python -m expense_tracker.storage convert parquet|arrow [csv folder] [target folder]
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "migrate":
+        folder = sys.argv[2] if len(sys.argv) > 2 else "."
+        target = sys.argv[3] if len(sys.argv) > 3 else "expenses.db"
+        counts = migrate_csv_to_sqlite(folder, target)
+    elif command == "convert" and len(sys.argv) > 2:
+        folder = sys.argv[3] if len(sys.argv) > 3 else "."
+        target = sys.argv[4] if len(sys.argv) > 4 else folder
+        counts = copy_data(CSVBackend(folder), ColumnarBackend(target, sys.argv[2]))
+    else:
+        sys.exit("usage: python -m expense_tracker.storage migrate [csv folder] [database file]\n"
+                 "       python -m expense_tracker.storage convert parquet|arrow [csv folder] [target folder]")
+    print(f"Imported {counts['expenses']} transactions, {counts['loans']} loans/debts "
+          f"and {counts['autopay']} autopay entries into {target}")
@@ -0,0 +1,157 @@
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Timing (and optionally memory) of the hot paths: loading and saving datasets, building
+# the ledger/rollups/index, the autopay scan, chart rendering and every app rerun.
+#
+#   EXPENSE_TRACKER_TELEMETRY=on      record span durations
+#   EXPENSE_TRACKER_TELEMETRY=memory  also record memory through tracemalloc (slower)
+#   EXPENSE_TRACKER_TRACE_FILE=path   append finished spans to this JSON-lines file
+#
+# A span is one timed block, `with telemetry.span("load.expenses"):`. Spans opened inside
+# another one are its children and share its trace, so one app rerun is one trace. The
+# exported lines use OpenTelemetry's span fields (trace_id, span_id, parent_span_id,
+# start/end_time_unix_nano, attributes), they can be loaded by tools that read OTLP JSON.
+# The last RECENT spans are also kept in memory for the app's Performance page.
+# Memory is process-wide: "alloc_mb" is what the block left allocated, "peak_mb" the
+# highest allocation above its start while it ran (spans on other threads count too).
+# With telemetry off span() is a shared no-op context.
+
+RECENT = 5000
+
+_recent = deque(maxlen=RECENT)
+_lock = threading.Lock()
+_current = contextvars.ContextVar("expense_tracker_span", default=None)
+_noop = contextlib.nullcontext()
+_mode = None
+
+
+def mode():
+    global _mode
+    if _mode is None:
+        value = os.environ.get("EXPENSE_TRACKER_TELEMETRY", "off").lower()
+        _mode = "memory" if value == "memory" else "on" if value in ("1", "on", "true", "yes") else "off"
+    return _mode
+
+
+def enabled():
+    return mode() != "off"
+
+
+#turn recording on or off at run time ("on", "memory" or "off")
+def configure(new_mode):
+    global _mode
+    _mode = new_mode
+    if new_mode == "memory" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def trace_file():
+    return os.environ.get("EXPENSE_TRACKER_TRACE_FILE")
+
+
+class Span:
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.parent = _current.get()
+        self.trace_id = self.parent.trace_id if self.parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.finished = [] if self.parent is None else self.parent.finished
+        self.memory = mode() == "memory" and tracemalloc.is_tracing()
+
+    def __enter__(self):
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak_seen = max(self.parent.peak_seen, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            self.peak_seen = current
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, kind, error, tb):
+        duration = time.perf_counter_ns() - self._started
+        _current.reset(self._token)
+        record = {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                  "parent_span_id": self.parent.span_id if self.parent else None,
+                  "start_time_unix_nano": self.start_ns, "end_time_unix_nano": self.start_ns + duration,
+                  "duration_ms": duration / 1e6, "attributes": self.attributes,
+                  "status": "ERROR" if kind is not None else "OK"}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.peak_seen)
+            record["alloc_mb"] = (current - self.start_memory) / 2 ** 20
+            record["peak_mb"] = (peak - self.start_memory) / 2 ** 20
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak_seen = max(self.parent.peak_seen, peak)
+        if kind is not None:
+            record["attributes"] = dict(self.attributes, error=f"{kind.__name__}: {error}")
+        self.finished.append(record)
+        if self.parent is None:
+            _finish(self.finished)
+        return False
+
+
+#Time the block as span `name`, `attributes` are stored with it (plain JSON values)
+def span(name, **attributes):
+    if mode() == "off":
+        return _noop
+    if mode() == "memory" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return Span(name, attributes)
+
+
+#a whole trace finished: keep its spans for the Performance page and export them
+def _finish(spans):
+    with _lock:
+        _recent.extend(spans)
+        path = trace_file()
+        if path:
+            with open(path, "a", encoding="utf-8") as f:
+                for record in spans:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+
+def recent():
+    with _lock:
+        return list(_recent)
+
+
+def clear():
+    with _lock:
+        _recent.clear()
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+#Per span name over the recent spans: count, p50/p95/max in ms and, with memory
+#recording, the p95 of the peak memory. Slowest p95 first.
+def summary(spans=None):
+    spans = recent() if spans is None else spans
+    by_name = {}
+    for record in spans:
+        by_name.setdefault(record["name"], []).append(record)
+    rows = []
+    for name, records in by_name.items():
+        times = sorted(r["duration_ms"] for r in records)
+        row = {"operation": name, "count": len(times), "p50_ms": _percentile(times, 0.5),
+               "p95_ms": _percentile(times, 0.95), "max_ms": times[-1], "total_ms": sum(times)}
+        peaks = sorted(r["peak_mb"] for r in records if "peak_mb" in r)
+        if peaks:
+            row["p95_peak_mb"] = _percentile(peaks, 0.95)
+        rows.append(row)
+    return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)
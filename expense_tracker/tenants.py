@@ -0,0 +1,172 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import datetime
+import threading
+from collections import OrderedDict
+
+from . import autopay_schedule
+from . import locking
+from . import storage
+
+# Multi-user mode (EXPENSE_TRACKER_USERS=on).
+# Every user gets a tenant: an opaque id and a folder of its own under
+# <EXPENSE_TRACKER_DATA>/tenants/<id>, holding that user's files for the configured
+# backend (CSV/Parquet/Arrow files, or an expenses.db for SQLite). Users never share a
+# file, so their writes never contend, and each tenant has its own Backend instance and
+# with it its own caches, ledger and rollups.
+#
+# Accounts live in <EXPENSE_TRACKER_DATA>/users.json with salted PBKDF2-HMAC-SHA256
+# password hashes. At most MAX_OPEN_TENANTS backends are kept open; the least recently
+# used one is closed (caches dropped) beyond that, so memory stays bounded with many users.
+# <EXPENSE_TRACKER_DATA>/autopay_due.json holds every tenant's earliest autopay Next Due,
+# updated whenever a tenant's autopay is saved, so the scheduler knows when each tenant
+# falls due without opening their files. Both JSON files are changed under a file lock
+# and replaced atomically, so several server processes can share them.
+
+ITERATIONS = 600_000
+MAX_OPEN_TENANTS = 256
+USERNAME = re.compile(r"[A-Za-z0-9_.@-]{3,64}")
+TENANT_ID = re.compile(r"[0-9a-f]{16}")
+MIN_PASSWORD = 8
+
+
+def _hash(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path, data):
+
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+
+    storage.replace_file(path, write)
+
+
+class UserStore:
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        return _load_json(self.path)
+
+    #Create an account, returns its tenant id
+    def register(self, username, password):
+        if not USERNAME.fullmatch(username or ""):
+            raise ValueError("Usernames are 3-64 letters, digits or . _ @ -")
+        if len(password or "") < MIN_PASSWORD:
+            raise ValueError(f"Passwords need at least {MIN_PASSWORD} characters")
+        salt = secrets.token_bytes(16)
+        #read-modify-write under the file lock, so a registration in another process isn't lost
+        with locking.lock_for(self.path + ".lock"):
+            users = self._load()
+            if username.lower() in users:
+                raise ValueError("That username is already taken")
+            tenant = secrets.token_hex(8)
+            users[username.lower()] = {"username": username, "tenant": tenant, "salt": salt.hex(),
+                                       "iterations": ITERATIONS, "hash": _hash(password, salt, ITERATIONS).hex()}
+            _save_json(self.path, users)
+        return tenant
+
+    #Tenant id of the account, or None if the username or password is wrong
+    def authenticate(self, username, password):
+        user = self._load().get((username or "").lower())
+        if user is None:
+            #hash anyway so unknown usernames take as long as wrong passwords
+            _hash(password or "", b"\0" * 16, ITERATIONS)
+            return None
+        expected = bytes.fromhex(user["hash"])
+        given = _hash(password or "", bytes.fromhex(user["salt"]), user["iterations"])
+        return user["tenant"] if hmac.compare_digest(expected, given) else None
+
+    def tenants(self):
+        return [user["tenant"] for user in self._load().values()]
+
+
+#Earliest autopay Next Due of every tenant (None: no rules that fall due)
+class DueIndex:
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return {tenant: datetime.date.fromisoformat(due) if due else None
+                for tenant, due in _load_json(self.path).items()}
+
+    def set(self, tenant, due):
+        with locking.lock_for(self.path + ".lock"):
+            entries = _load_json(self.path)
+            entries[tenant] = due.isoformat() if due else None
+            _save_json(self.path, entries)
+
+
+class Tenants:
+
+    def __init__(self, root=".", kind="csv"):
+        self.root = root
+        self.kind = kind
+        self.users = UserStore(os.path.join(root, "users.json"))
+        self.due = DueIndex(os.path.join(root, "autopay_due.json"))
+        self._backends = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    #call `listener(tenant)` whenever a tenant's entry in the due index changes
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def folder(self, tenant):
+        if not TENANT_ID.fullmatch(tenant or ""):
+            raise ValueError(f"Invalid tenant id: {tenant!r}")
+        return os.path.join(self.root, "tenants", tenant)
+
+    #The tenant's backend, marked as recently used. A tenant closed for being idle gets a
+    #new instance; one still held by a running request keeps working, just without caches.
+    def backend(self, tenant):
+        closed = []
+        with self._lock:
+            backend = self._backends.get(tenant)
+            if backend is not None:
+                self._backends.move_to_end(tenant)
+                return backend
+            folder = self.folder(tenant)
+            os.makedirs(folder, exist_ok=True)
+            backend = self._backends[tenant] = storage.open_backend(self.kind, folder)
+            while len(self._backends) > MAX_OPEN_TENANTS:
+                closed.append(self._backends.popitem(last=False)[1])
+        for idle in closed:
+            idle.close()
+        backend.subscribe("autopay", lambda: self.refresh_due(tenant, backend))
+        return backend
+
+    #recompute the tenant's entry in the due index from its autopay rules
+    def refresh_due(self, tenant, backend=None):
+        backend = backend or self.backend(tenant)
+        self.due.set(tenant, autopay_schedule.earliest_due(backend.load_autopay()))
+        for listener in self._listeners:
+            listener(tenant)
+
+
+def enabled():
+    return os.environ.get("EXPENSE_TRACKER_USERS", "off").lower() in ("1", "on", "true", "yes")
+
+
+_tenants = None
+
+def get_tenants():
+    global _tenants
+    if _tenants is None:
+        _tenants = Tenants(os.environ.get("EXPENSE_TRACKER_DATA", "."), storage.backend_kind())
+    return _tenants
@@ -0,0 +1,256 @@
+import csv
+import json
+import os
+import struct
+import threading
+import zlib
+
+from . import locking
+
+# Append-only log that sits next to a CSV file (expenses.csv -> expenses.csv.log).
+# New rows are appended here as single framed records instead of rewriting the CSV,
+# and a background compaction folds them back into the CSV once the log gets big.
+#
+# Every record is framed as a 4-byte length, a 4-byte crc32 and a JSON payload holding
+# one appended batch of rows, so a batch is all-or-nothing. A write torn by a crash
+# fails the length/crc check and is dropped on replay.
+# The first record of a log is a header remembering which CSV file (inode) and how
+# many bytes of it existed when the log was started, so a compaction that crashed
+# half way can be detected and redone instead of duplicating rows.
+
+FRAME = struct.Struct(">II")
+COMPACT_AFTER_BYTES = 256 * 1024
+
+#guards the module's bookkeeping below; the files themselves are guarded per path by locked()
+_state_lock = threading.Lock()
+_repaired = set()
+_compacting = set()
+_compaction_hooks = {}
+_folders = {}
+
+
+def log_path(path):
+    return path + ".log"
+
+
+#The log lock of `path`, held by every log operation and by readers that combine the CSV
+#with pending rows. It is the file lock of that path only (other processes, and threads
+#through its RLock), so one ledger's reads never wait for another's. The backend's write
+#lock is the same file lock, so it can be held around it.
+def locked(path):
+    return locking.lock_for(path + ".lock")
+
+
+def _identity(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return [None, 0]
+    return [st.st_ino, st.st_size]
+
+
+def _to_builtin(value):
+    #numpy scalars (e.g. a balance read back with read_csv) are not JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in the transaction log")
+
+
+def _frame(obj):
+    payload = json.dumps(obj, default=_to_builtin).encode("utf-8")
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+#Read every intact record, returns the records and the byte offset where they end
+def _read_records(log):
+    if not os.path.exists(log):
+        return [], 0
+    with open(log, "rb") as f:
+        data = f.read()
+    records = []
+    pos = 0
+    while pos + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, pos)
+        start = pos + FRAME.size
+        end = start + length
+        if end > len(data):
+            break
+        payload = data[start:end]
+        if zlib.crc32(payload) != crc:
+            break
+        records.append(json.loads(payload))
+        pos = end
+    return records, pos
+
+
+def _fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+#Columns the log's rows are written in, None when there is no log
+def log_columns(path):
+    with locked(path):
+        records, _ = _read_records(log_path(path))
+        return records[0]["columns"] if records else None
+
+
+#Rows appended since the last compaction, in the order they were written
+def pending_rows(path):
+    with locked(path):
+        records, _ = _read_records(log_path(path))
+        if len(records) <= 1:
+            return []
+        base_inode, base_size = records[0]["base"]
+        inode, size = _identity(path)
+        if base_inode is not None and inode != base_inode:
+            #the CSV was replaced by a full rewrite that already holds these rows
+            return []
+        if base_inode is None and inode is not None:
+            return []
+        if base_inode is not None and size != base_size:
+            #a compaction crashed after touching the CSV, finish it before reading
+            _compact_locked(path)
+            return []
+        return _rows(records[1:])
+
+
+def _rows(records):
+    rows = []
+    for record in records:
+        #logs written before batches were framed together hold one "row" per record
+        rows.extend(record["rows"] if "rows" in record else [record["row"]])
+    return rows
+
+
+#Append a batch of rows as one record with fsync, this never reads or rewrites the CSV itself
+def append_many(path, rows, columns):
+    log = log_path(path)
+    with locked(path):
+        if log not in _repaired:
+            #drop a torn tail left behind by a crash so new records stay readable
+            _, good_end = _read_records(log)
+            if os.path.exists(log) and os.path.getsize(log) != good_end:
+                with open(log, "r+b") as f:
+                    f.truncate(good_end)
+            _repaired.add(log)
+        with open(log, "ab") as f:
+            if f.tell() == 0:
+                f.write(_frame({"base": _identity(path), "columns": list(columns)}))
+            f.write(_frame({"rows": [list(row) for row in rows]}))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+    if size > COMPACT_AFTER_BYTES:
+        compact_in_background(path)
+
+
+#For files that cannot be appended to in place (Parquet/Arrow), `fold(path, rows, columns)`
+#is used instead of the CSV append. It must write the old contents plus `rows` to a new
+#file and os.replace() it over `path`; the new inode tells replay the log is folded in.
+def set_folder(path, fold):
+    _folders[path] = fold
+
+
+#`hook(stage)` is called with "before" and "after" around every compaction of `path`,
+#while the lock is held. Compaction does not change the data, only where it is stored,
+#so caches can use this to carry their entries over.
+def on_compaction(path, hook):
+    with _state_lock:
+        _compaction_hooks.setdefault(path, []).append(hook)
+
+
+def remove_compaction_hook(path, hook):
+    with _state_lock:
+        hooks = _compaction_hooks.get(path, [])
+        if hook in hooks:
+            hooks.remove(hook)
+        if not hooks:
+            _compaction_hooks.pop(path, None)
+
+
+#Fold the log into the CSV. Safe to rerun at any point after a crash.
+def compact(path):
+    with locked(path):
+        with _state_lock:
+            hooks = list(_compaction_hooks.get(path, []))
+        for hook in hooks:
+            hook("before")
+        _compact_locked(path)
+        for hook in hooks:
+            hook("after")
+
+
+def _compact_locked(path):
+    log = log_path(path)
+    records, _ = _read_records(log)
+    if len(records) <= 1:
+        if os.path.exists(log):
+            os.remove(log)
+        return
+    base_inode, base_size = records[0]["base"]
+    columns = records[0]["columns"]
+    rows = _rows(records[1:])
+    inode, _ = _identity(path)
+
+    fold = _folders.get(path)
+    if fold is not None:
+        if base_inode == inode:
+            fold(path, rows, columns)
+            _fsync_dir(path)
+    elif base_inode is None and inode is None:
+        #no CSV yet, create it in one atomic step
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(path)
+    elif base_inode is not None and inode == base_inode:
+        #cut back anything a crashed compaction appended, then append the rows
+        with open(path, "r+", newline="", encoding="utf-8") as f:
+            f.truncate(base_size)
+            f.seek(base_size)
+            csv.writer(f).writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+    #otherwise the CSV was rewritten after the log started and already has the rows
+    os.remove(log)
+    _fsync_dir(log)
+
+
+def compact_in_background(path):
+    with _state_lock:
+        if path in _compacting:
+            return
+        _compacting.add(path)
+
+    def run():
+        try:
+            compact(path)
+        finally:
+            with _state_lock:
+                _compacting.discard(path)
+
+    threading.Thread(target=run, name=f"compact-{os.path.basename(path)}", daemon=True).start()
+
+
+#Replace the whole CSV atomically. Pending log rows are folded in first so that
+#the rewrite (which the caller built from load + pending rows) supersedes them.
+def rewrite(path, write):
+    with locked(path):
+        _compact_locked(path)
+        tmp = path + ".tmp"
+        write(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(path)
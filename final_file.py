@@ -1,121 +1,159 @@
 import streamlit as st
 import pandas as pd
-import os
 import datetime
-import matplotlib.pyplot as plt
+from expense_tracker import core, scheduler, storage, telemetry, tenants
 
 st.set_page_config(page_title="Personal Expense Tracker", layout="wide")
-filepath = "expenses.csv"
-balancefile = "balance.csv"
-loans_and_debts = "loans_and_debts.csv"
-autopay_file="autopay.csv"
 
 
-# --- Load & Save Functions ---
+# --- Accounts (multi-user mode, EXPENSE_TRACKER_USERS=on) ---
+# Each user only ever sees the backend of their own tenant
+def login_page(registry):
+    st.title("Personal Expense Tracker")
+    login_tab, signup_tab = st.tabs(["Log in", "Sign up"])
+    with login_tab:
+        username = st.text_input("Username", key="login_username")
+        password = st.text_input("Password", type="password", key="login_password")
+        if st.button("Log in"):
+            tenant = registry.users.authenticate(username, password)
+            if tenant is None:
+                st.error("⚠ Wrong username or password.")
+            else:
+                st.session_state.tenant = tenant
+                st.session_state.username = username
+                st.rerun()
+    with signup_tab:
+        new_username = st.text_input("Username", key="signup_username")
+        new_password = st.text_input("Password", type="password", key="signup_password")
+        if st.button("Create account"):
+            try:
+                st.session_state.tenant = registry.users.register(new_username, new_password)
+                st.session_state.username = new_username
+                st.rerun()
+            except ValueError as e:
+                st.error(f"⚠ {e}")
+
+
+if tenants.enabled():
+    registry = tenants.get_tenants()
+    if "tenant" not in st.session_state:
+        login_page(registry)
+        st.stop()
+    backend = registry.backend(st.session_state.tenant)
+    st.sidebar.write(f"Logged in as **{st.session_state.username}**")
+    if st.sidebar.button("Log out"):
+        st.session_state.clear()
+        st.rerun()
+else:
+    backend = storage.get_backend()
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
 
-#Load main expenses csv file
-def load_data():
-    if os.path.exists(filepath):
-        return pd.read_csv(filepath)
-    else:
-        return pd.DataFrame(columns=["Date","Transaction","Category","Description","Amount","Bank Balance"])
 
-#save changes to the expenses csv file
-def save_data(df):
-    df.to_csv(filepath, index=False)
+# --- Load & Save Functions ---
+# All reads and writes go through the storage backend (CSV files by default,
+# SQLite with EXPENSE_TRACKER_BACKEND=sqlite)
 
-#Load and Save the current balance
+#Current balance = running balance stored on the latest transaction
 def load_balance():
-    if os.path.exists(balancefile):
-        return pd.read_csv(balancefile).iloc[0,0]
-    else:
-        return 10000
+    return backend.load_balance()
 
+#Save the opening balance, entered once before the first transaction
 def save_balance(balance):
-    pd.DataFrame([{"Balance": balance}]).to_csv(balancefile, index=False)
+    backend.save_balance(balance)
 
 
-def calculate_expenses(csv_file):
-    if "Transaction" in csv_file.columns and "Amount" in csv_file.columns:
-        return csv_file[csv_file["Transaction"] == "Expenditure"]["Amount"].sum()
+#Save current loans and debts
+#with `base` from backend.checkout(), changes saved by other sessions since are merged in
+def save_loans(df, base=None):
+    return backend.save_loans(df, base)
 
-#Load and save current loans and debts
-def load_loans():
-    if os.path.exists(loans_and_debts):
-        return pd.read_csv(loans_and_debts)
-    else:
-        return pd.DataFrame(columns=["Date","Transaction","To","Description","Amount","Status"])
+#function to add expenses, returns the new balance
+#only the new row is written (with its running balance)
+def add_expense(date,category,description,amount):
+    return core.add_expense(backend, date, category, description, amount)
 
-def save_loans(df):
-    df.to_csv(loans_and_debts, index=False)
+#function to add income, returns the new balance
+def add_income(category,date,description,amount):
+    return core.add_income(backend, date, category, description, amount)
 
-#function to add expenses
-def add_expense(expenses,date,category,description,amount,balance):
-    if not isinstance(date, str):
-        date_str = date.strftime("%Y-%m-%d")
-    else:
-        date_str = date
-    balance -= amount
-    
-    new_expense = pd.DataFrame([[date_str,"Expenditure",category,description,amount,balance]],
-                                       columns=["Date","Transaction","Category","Description","Amount","Bank Balance"])
-    expenses = pd.concat([expenses,new_expense], ignore_index=True)
-    save_balance(balance)
-    save_data(expenses)
-    return expenses,balance
-
-#function to add income
-def add_income(expenses,category,date,description,amount,balance):
-    if not isinstance(date, str):
-        date_str = date.strftime("%Y-%m-%d")
-    else:
-        date_str = date
-    balance += amount
-    new_income = pd.DataFrame([[date_str,"Income",category,description,amount,balance]],
-                                      columns=["Date","Transaction","Category","Description","Amount","Bank Balance"])
-    expenses = pd.concat([expenses,new_income], ignore_index=True)
-    save_data(expenses)
-    save_balance(balance)
-
-
-def net_expenditure(csv_file):
-    expenditure=csv_file[csv_file["Transaction"] == "Expenditure"]["Amount"].sum()
-    income=csv_file[csv_file["Transaction"]=="Income"]["Amount"].sum()
-    return income-expenditure
-
-#Load and save current working autopay
-def load_autopay():
-    if os.path.exists(autopay_file):
-        return pd.read_csv(autopay_file)
+#Save current working autopay
+def save_autopay(df, base=None):
+    return backend.save_autopay(df, base)
+
+
+#One page of a dataset, only these rows are sent to the browser. The cursor lives in the
+#session under `key` and starts over when the sort or filters change.
+def load_page(name, key, sort="ID", descending=False, **filters):
+    signature = repr((sort, descending, filters))
+    if st.session_state.get(key + "_for") != signature:
+        st.session_state[key + "_for"] = signature
+        st.session_state[key] = {}
+    return backend.page(name, sort, descending, **st.session_state[key], **filters)
+
+
+#Previous / Next buttons under a page
+def page_buttons(key, page):
+    col1, col2 = st.columns(2)
+    with col1:
+        if page.prev is not None and st.button("⬅ Previous", key=key + "_prev"):
+            st.session_state[key] = {"before": page.prev}
+            st.rerun()
+    with col2:
+        if page.next is not None and st.button("Next ➡", key=key + "_next"):
+            st.session_state[key] = {"after": page.next}
+            st.rerun()
+
+
+def show_page(name, key, sort="ID", descending=False, **filters):
+    page = load_page(name, key, sort, descending, **filters)
+    st.dataframe(page.rows, use_container_width=True, hide_index=True)
+    page_buttons(key, page)
+
+
+#Autopay runs on one background thread per server process instead of on every rerun
+@st.cache_resource
+def start_autopay_scheduler():
+    if tenants.enabled():
+        autopay_scheduler = scheduler.for_tenants(tenants.get_tenants())
     else:
-        return pd.DataFrame(columns=["Start Date","Transaction","Category","Description","Amount","Frequency","Next Due"])
-def save_autopay(df):
-    df.to_csv(autopay_file,index=False)
+        autopay_scheduler = scheduler.AutopayScheduler(backend)
+    autopay_scheduler.start()
+    return autopay_scheduler
 
+if scheduler.enabled():
+    start_autopay_scheduler()
 
-# --- Load Data ---
-expenses = load_data()
-balance = load_balance()
-loans = load_loans()
-autopay=load_autopay()
 
+# --- Page Data ---
+# Each page lists the datasets it reads (see PAGES at the bottom) and gets them through
+# PageData, which loads one the first time the page uses it. These are the backend's
+# derived views, not whole tables: the balance from the ledger, the precomputed rollups and
+# the loan positions. They are built once and served from the backend cache on reruns.
+# Rows are read a page at a time with load_page() instead.
+LOADERS = {"balance": load_balance, "rollups": backend.rollups, "positions": backend.positions}
 
-# --- Navigation ---
-if "page" not in st.session_state:
-    st.session_state.page = "Home"
 
-st.sidebar.header("Menu")
-if st.sidebar.button("Home"): st.session_state.page = "Home"
-if st.sidebar.button("Add Transactions"): st.session_state.page = "Add Transactions"
-if st.sidebar.button("View Transactions"): st.session_state.page = "View Transactions"
-if st.sidebar.button("Analytics and Report"): st.session_state.page = "Analytics and Report"
-if st.sidebar.button("Loans and Debts"): st.session_state.page = "Loans and Debts"
-if st.sidebar.button("AutoPay"): st.session_state.page = "AutoPay"
+class PageData:
+
+    def __init__(self, needs):
+        self.needs = needs
+        self._loaded = {}
+
+    def __getattr__(self, name):
+        if name not in self.needs:
+            raise AttributeError(f"{name} is not one of this page's datasets {self.needs}")
+        if name not in self._loaded:
+            self._loaded[name] = LOADERS[name]()
+        return self._loaded[name]
+
 
 # --- Home Page ---
-if st.session_state.page == "Home":
+def home_page(data):
+    #the newest rows come as one small page
+    recent = backend.page("expenses", "ID", True, limit=5)
     #if no balance has been set, user is asked to input balance
-    if not os.path.exists(balancefile):
+    if not backend.has_balance() and recent.rows.empty:
         initial_balance = st.number_input("Enter your bank balance:", value=10000)
         if st.button("Save Balance"):
             save_balance(initial_balance)
@@ -123,28 +161,29 @@ if st.session_state.page == "Home":
 
     
     st.title("Dashboard")
-    recent = load_data()
-    loans=load_loans()
-    auto=load_autopay()
-    total_expense = calculate_expenses(recent)
+    #tiles read the precomputed rollups instead of filtering every row
+    totals = data.rollups
     col1, col2,col3 = st.columns(3)
     with col1:
-        st.markdown(f"<h4>Current Balance: ₹{balance}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Current Balance: ₹{data.balance}</h4>", unsafe_allow_html=True)
     with col2:
-        st.markdown(f"<h4>Total Expenditure: ₹{total_expense}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Total Expenditure: ₹{totals.total('Expenditure')}</h4>", unsafe_allow_html=True)
     with col3:
-        st.markdown(f"<h4>Net Savings: ₹{net_expenditure(recent)}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Net Savings: ₹{totals.net()}</h4>", unsafe_allow_html=True)
 
 
     st.subheader("Recent Transactions")
-    st.table(recent.tail(5))
+    st.table(recent.rows.iloc[::-1])
     st.subheader("Recent Loans and Debts")
-    st.table(loans.tail(5))
+    st.table(backend.page("loans", "ID", True, limit=5).rows.iloc[::-1])
     st.subheader("Working Autopay")
-    st.table(auto)
+    autopay_page = load_page("autopay", "home_autopay", "Next Due")
+    st.table(autopay_page.rows)
+    page_buttons("home_autopay", autopay_page)
 
 # --- Add Transactions ---
-elif st.session_state.page == "Add Transactions":
+def add_transactions_page(data):
+    from expense_tracker import importer
     st.title("Add Transaction")
 
     # --- Add Expense ---
@@ -159,7 +198,7 @@ elif st.session_state.page == "Add Transactions":
 
     if st.button("Add Expense"):
         if expense_date and expense_category != "Select..." and expense_amount > 0:
-            add_expense(expenses,expense_date,expense_category,expense_description,expense_amount,balance)
+            add_expense(expense_date,expense_category,expense_description,expense_amount)
             st.success("Expense added!")
         else:
             st.error("⚠ Please fill in Date, Category, and Amount to add an expense.")
@@ -172,35 +211,45 @@ elif st.session_state.page == "Add Transactions":
 
     if st.button("Add Income"):
         if income_date and income_amount > 0:
-            add_income(expenses,"",income_date,income_description,income_amount,balance)
+            add_income("",income_date,income_description,income_amount)
             st.success("Income Added!")
         else:
             st.error("⚠ Please fill in Date and Amount to add income.")
 
-elif st.session_state.page == "View Transactions":
+    # --- Import Bank Statement ---
+    st.markdown("<h2>Import Bank Statement</h2>", unsafe_allow_html=True)
+    statement = st.file_uploader("Statement file", type=sorted(importer.READERS))
+    statement_dayfirst = st.checkbox("Dates are written day first (31/01/2024)")
+
+    if st.button("Import Statement"):
+        if statement is not None:
+            try:
+                count = importer.import_statement(statement, backend, dayfirst=statement_dayfirst)
+                st.success(f"Imported {count} transactions!")
+            except ValueError as e:
+                st.error(f"⚠ Could not import {statement.name}: {e}")
+        else:
+            st.error("⚠ Please choose a statement file to import.")
+
+# --- View Transactions ---
+def view_transactions_page(data):
     st.title("View Transactions")
-    
-    view = load_data()
-    loans=load_loans()
-    auto=load_autopay()
-    col1, col2,col3 = st.columns(3)
-    total_expense = calculate_expenses(view)
+
+    #tiles come from the rollups, bounds and filters are answered by the storage backend (SQL on sqlite)
+    totals = data.rollups
     col1, col2,col3 = st.columns(3)
     with col1:
-        st.markdown(f"<h4>Current Balance: ₹{balance}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Current Balance: ₹{data.balance}</h4>", unsafe_allow_html=True)
     with col2:
-        st.markdown(f"<h4>Total Expenditure: ₹{total_expense}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Total Expenditure: ₹{totals.total('Expenditure')}</h4>", unsafe_allow_html=True)
     with col3:
-        st.markdown(f"<h4>Net Savings: ₹{net_expenditure(view)}</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>Net Savings: ₹{totals.net()}</h4>", unsafe_allow_html=True)
     st.subheader("Filter")
-    view["Date"] = pd.to_datetime(view["Date"])
 
-    if not view.empty and view["Date"].notna().any():
-        min_date = view["Date"].min().date()
-        max_date = view["Date"].max().date()
-    else:
-    # Fallback to today's date if no valid data
-        import datetime
+    min_date, max_date = backend.date_bounds()
+    has_transactions = min_date is not None
+    if not has_transactions:
+        # Fallback to today's date if no valid data
         min_date = datetime.date.today()
         max_date = datetime.date.today()
 
@@ -211,80 +260,70 @@ elif st.session_state.page == "View Transactions":
         to_date = st.date_input("To", max_date)
 
 
-    categories = st.multiselect("Select Category", view["Category"].unique())
-    transaction_type = st.multiselect("Transaction Type", view["Transaction"].unique())
-
-    # Filter by date
-    filtered = view[
-        (view["Date"].dt.date >= from_date) &
-        (view["Date"].dt.date <= to_date)
-    ]
-
-    # Filter by category
-    if categories:
-        filtered = filtered[filtered["Category"].isin(categories)]
-
-    # Filter by transaction type
-    if transaction_type:
-        filtered = filtered[filtered["Transaction"].isin(transaction_type)]
+    categories = st.multiselect("Select Category", backend.distinct("Category"))
+    transaction_type = st.multiselect("Transaction Type", backend.distinct("Transaction"))
 
     if st.button("Show"):
-        st.dataframe(filtered)
-        st.markdown(f"Total expense: {calculate_expenses(filtered)}")
+        st.session_state.show_filtered = True
+    if st.session_state.get("show_filtered"):
+        filters = dict(start=from_date, end=to_date, categories=categories, transactions=transaction_type)
+        show_page("expenses", "filtered_page", "Date", True, **filters)
+        st.markdown(f"Total expense: {backend.totals_by_transaction(**filters).get('Expenditure', 0)}")
+
+    # Balance on a given date, answered from the ledger's prefix-sum index
+    st.subheader("Balance on a Date")
+    as_of = st.date_input("Balance as of", max_date, key="balance_as_of")
+    st.markdown(f"Balance at the end of {as_of}: ₹{backend.balance_as_of(as_of):.2f}")
 
     # Filter by Month
     st.subheader("Filter by Month")
-    month = st.selectbox(
-        "Select Month",
-        ["January", "February", "March", "April", "May", "June",
-         "July", "August", "September", "October", "November", "December"]
-    )
+    month = st.selectbox("Select Month", MONTHS)
 
     if st.button(f"Show transactions for {month}"):
-        if not view.empty:
-            # Ensure Date column is datetime
-            view["Date"] = pd.to_datetime(view["Date"])
-            # Extract month name from Date
-            view["Month"] = view["Date"].dt.month_name()
-            # Filter by selected month
-            filtered = view[view["Month"] == month]
-
-            if not filtered.empty:
-                st.subheader(f"Transactions for {month}")
-                st.dataframe(filtered)
-                st.markdown(f"Total expense for {month}: {calculate_expenses(filtered)}")
-            else:
-                st.warning(f"No transactions found for {month}.")
+        st.session_state.shown_month = month
+    if st.session_state.get("shown_month") == month:
+        month_totals = backend.totals_by_transaction(month=MONTHS.index(month) + 1)
+        if month_totals:
+            st.subheader(f"Transactions for {month}")
+            show_page("expenses", "month_page", "Date", True, month=MONTHS.index(month) + 1)
+            st.markdown(f"Total expense for {month}: {month_totals.get('Expenditure', 0)}")
+        elif has_transactions:
+            st.warning(f"No transactions found for {month}.")
         else:
             st.info("No transactions recorded yet.")
 
     # Show all transactions
     st.subheader("All Transactions")
     if st.button("Show All Transactions"):
-        st.dataframe(view)
-        st.markdown(f"Total expenses: {calculate_expenses(view)}")
+        st.session_state.show_all = True
+    if st.session_state.get("show_all"):
+        show_page("expenses", "all_page", "Date", True)
+        st.markdown(f"Total expenses: {totals.total('Expenditure')}")
     #Show all loans and debts
     st.subheader("All Loans and Debts")
     if st.button("Show All Loans and Debts"):
-        st.dataframe(loans)
-        if "Transaction" in loans.columns and "Amount" in loans.columns:
-            ex= loans[loans["Transaction"] == "Debt"]["Amount"].sum()
+        st.session_state.show_loans = True
+    if st.session_state.get("show_loans"):
+        show_page("loans", "loans_page", "Date", True)
+        ex = data.positions.total_owed_by_me()
         st.markdown(f"Total debt to pay: {ex}")
     #Show all Autopay
     st.subheader("All Working Autopay")
     if st.button("Show All Working Autopay"):
-        st.dataframe(autopay)
+        st.session_state.show_autopay = True
+    if st.session_state.get("show_autopay"):
+        show_page("autopay", "autopay_page", "Next Due")
 
 
 
 
 # --- Loans and Debts ---
-elif st.session_state.page == "Loans and Debts":
+def loans_and_debts_page(data):
     st.header("Loans and Debts")
 
-    # --- Initialize loans in session state ---
-    if "loans" not in st.session_state:
-        st.session_state.loans = loans.copy()
+    # --- Only one page of loans is loaded per rerun, registering and settling write single rows ---
+    loans_page = load_page("loans", "settle_page", "Date", True)
+    st.session_state.loans = loans_page.rows.copy()
 
     # Ensure "Select" column exists
     if "Select" not in st.session_state.loans.columns:
@@ -301,13 +340,7 @@ elif st.session_state.page == "Loans and Debts":
 
     if st.button("Register Loan", key="loan_register"):
         if loan_date and given_to.strip() != "" and loan_amount > 0:
-            loan_date_str = loan_date.strftime("%Y-%m-%d")
-            new_loan = pd.DataFrame(
-                [[loan_date_str, "Loan", given_to, loan_description, loan_amount, "Unpaid", False]],
-                columns=["Date", "Transaction", "To", "Description", "Amount", "Status", "Select"]
-            )
-            st.session_state.loans = pd.concat([st.session_state.loans, new_loan], ignore_index=True)
-            save_loans(st.session_state.loans)
+            backend.register_loan(loan_date, "Loan", given_to, loan_description, loan_amount)
             st.success("Loan registered successfully!")
         else:
             st.error("⚠ Please enter Date, Loan Given To and Amount.")
@@ -323,13 +356,7 @@ elif st.session_state.page == "Loans and Debts":
 
     if st.button("Register Debt", key="debt_register"):
         if debt_date and indebted_to.strip() != "" and debt_amount > 0:
-            debt_date_str = debt_date.strftime("%Y-%m-%d")
-            new_debt = pd.DataFrame(
-                [[debt_date_str, "Debt", indebted_to, debt_description, debt_amount, "Unpaid", False]],
-                columns=["Date", "Transaction", "To", "Description", "Amount", "Status", "Select"]
-            )
-            st.session_state.loans = pd.concat([st.session_state.loans, new_debt], ignore_index=True)
-            save_loans(st.session_state.loans)
+            backend.register_loan(debt_date, "Debt", indebted_to, debt_description, debt_amount)
             st.success("Debt registered successfully!")
         else:
             st.error("⚠ Please enter Date, Indebted To and Amount.")
@@ -346,44 +373,61 @@ elif st.session_state.page == "Loans and Debts":
             column_config={
                 "Select": st.column_config.CheckboxColumn("Select Row")
             },
-            disabled=["Transaction", "Amount", "Status"]  # prevent editing other columns
+            disabled=["ID", "Transaction", "Amount", "Status", "Paid"]  # prevent editing other columns
         )
         selected_rows = edited_df[edited_df["Select"]]
+        page_buttons("settle_page", loans_page)
 
         # Button to update status of selected rows
         if st.button("Settle Up"):
             if not selected_rows.empty:
-                for idx, row in st.session_state.loans.loc[selected_rows.index].iterrows():
-                    if row["Status"] == "Settled":
-                        st.warning(f'{row["Transaction"]} already settled')
-                    elif row["Transaction"] == "Debt" and row["Status"] != "Settled":
-                        st.session_state.loans.at[idx, "Status"] = "Settled"
-                        expenses,balance=add_expense(
-                            expenses, row["Date"], "Debt",
-                            f"settled debt with {row['To']}", row["Amount"], balance
-                        )
-
-                        st.success("Expense added!")
-                        
-                    elif row["Transaction"] == "Loan" and row["Status"] != "Settled":
-                        st.session_state.loans.at[idx, "Status"] = "Settled"
-                        add_income(
-                            expenses, "Loan", row["Date"],
-                            f"Loan paid by {row['To']}", row["Amount"], balance
-                        )
-                        st.success("Income Added!")
-                        
-
-                save_loans(st.session_state.loans)
-                st.success("✅ Selected loans/debts settled!")
-
+                # every ledger entry and the new statuses are written as one batch
+                settled, already = backend.settle_loans(selected_rows["ID"])
+                for _, row in selected_rows[selected_rows["ID"].isin(already)].iterrows():
+                    st.warning(f'{row["Transaction"]} already settled')
+                if settled:
+                    st.success(f"✅ {len(settled)} selected loans/debts settled!")
             else:
                 st.warning("No rows selected.")
 
+        # --- Pay back part of one loan/debt ---
+        st.subheader("Partial Payment")
+        open_loans = loans_page.rows
+        open_loans = open_loans[open_loans["Status"] != "Settled"]
+        if not open_loans.empty:
+            part_id = st.selectbox("Loan/Debt (on this page)", open_loans["ID"].tolist(),
+                                   format_func=lambda i: " - ".join(str(v) for v in open_loans[open_loans["ID"] == i]
+                                                                     [["Transaction", "To", "Amount", "Paid"]].iloc[0]))
+            part_amount = st.number_input("Amount Paid", min_value=0.0, format="%.2f", key="part_amount")
+            if st.button("Record Payment"):
+                if part_amount > 0:
+                    paid, _ = backend.settle_loans([part_id], [part_amount])
+                    if paid:
+                        st.success("Payment recorded!")
+                    else:
+                        st.warning("That loan/debt is already settled")
+                else:
+                    st.error("⚠ Please enter the amount paid.")
+
+    # --- Net position per person ---
+    st.header("Who Owes What")
+    positions = data.positions
+    st.markdown(f"Owed to you: {positions.total_owed_to_me():.2f}  |  You owe: {positions.total_owed_by_me():.2f}")
+    st.dataframe(positions.table(), use_container_width=True)
+
 #---AutoPay---
-elif st.session_state.page=="AutoPay":
+AUTOPAY_ACTIONS = ("autopay_add", "autopay_save", "autopay_delete")
+
+def autopay_page(data):
     st.header("Setup Autopay")
-    autopay = load_autopay()
+    #The table as it was shown is kept in the session. A save compares against that
+    #version, so rows another tab saved in the meantime are merged in, not overwritten.
+    #It is checked out again on every rerun that doesn't save.
+    if "autopay_shown" not in st.session_state or not any(st.session_state.get(key) for key in AUTOPAY_ACTIONS):
+        st.session_state.autopay_shown = backend.checkout("autopay")
+    autopay, autopay_version = st.session_state.autopay_shown
+    autopay_base = (autopay.copy(), autopay_version)
+    autopay = autopay.copy()
     st.dataframe(autopay)
 
     auto_date = st.date_input("Start Date")
@@ -392,15 +436,16 @@ elif st.session_state.page=="AutoPay":
     auto_amount = st.number_input("Amount", min_value=0.0, format="%.2f")
     auto_freq = st.selectbox("Frequency", ["Daily","Weekly","Monthly","Yearly"])
 
-    if st.button("Add AutoPay"):
+    if st.button("Add AutoPay", key="autopay_add"):
         if auto_description and auto_amount > 0:
             new_autopay = pd.DataFrame([[
                 auto_date.strftime("%Y-%m-%d"), "Expenditure", auto_category, auto_description,
                 auto_amount, auto_freq, auto_date.strftime("%Y-%m-%d")
             ]], columns=["Start Date","Transaction","Category","Description","Amount","Frequency","Next Due"])
             
-            autopay = pd.concat([autopay, new_autopay], ignore_index=True)
-            save_autopay(autopay)
+            save_autopay(pd.concat([autopay, new_autopay], ignore_index=True), autopay_base)
+            st.session_state.autopay_shown = backend.checkout("autopay")
+            autopay = st.session_state.autopay_shown[0].copy()
             st.success("AutoPay Registered!")
         else:
             st.error("Please provide a description and amount.")
@@ -426,16 +471,16 @@ elif st.session_state.page=="AutoPay":
         col1, col2 = st.columns(2)
 
         with col1:
-            if st.button("Save Changes"):
+            if st.button("Save Changes", key="autopay_save"):
                 updated = edited.drop(columns=["Select"])
-                save_autopay(updated)
+                save_autopay(updated, autopay_base)
                 st.rerun()
                 st.success("Changes saved to autopay!")
 
         with col2:
-            if st.button("Delete Selected"):
+            if st.button("Delete Selected", key="autopay_delete"):
                 updated = edited[edited["Select"] == False].drop(columns=["Select"])
-                save_autopay(updated)
+                save_autopay(updated, autopay_base)
                 st.rerun()
                 st.success("Selected autopay entries deleted!")
     else:
@@ -445,21 +490,22 @@ elif st.session_state.page=="AutoPay":
 
 
 # --- Analytics and Reports ---
-elif st.session_state.page == "Analytics and Report":
+#charts (and with them matplotlib or altair) are only imported once this page is opened
+def analytics_page(data):
+    from expense_tracker import charts
     st.header("Analytics and Reports")
-    view = load_data()
-    
-    if view is None or view.shape[0] == 0:
+    # totals, the chart series and the top expenses all come from the precomputed rollups,
+    # the transactions themselves are not loaded (see EXPENSE_TRACKER_AGGREGATION=stream)
+    totals = data.rollups
+
+    if not totals.by_type:
         st.warning("No transactions available for analytics.")
 
     else:
-        # Convert Date once
-        view["Date"] = pd.to_datetime(view["Date"], errors="coerce")
-
         # --- Total Metrics ---
-        total_income = view[view["Transaction"] == "Income"]["Amount"].sum()
-        total_expense = view[view["Transaction"] == "Expenditure"]["Amount"].sum()
-        net_savings = total_income - total_expense
+        total_income = totals.total("Income")
+        total_expense = totals.total("Expenditure")
+        net_savings = totals.net()
 
         metric_col1, metric_col2, metric_col3 = st.columns(3)
         metric_col1.metric("Total Income", f"₹{total_income:.2f}")
@@ -467,91 +513,104 @@ elif st.session_state.page == "Analytics and Report":
         metric_col3.metric("Net Savings", f"₹{net_savings:.2f}")
 
         # --- Category-wise Expenses Pie Chart ---
-        category_expenses = view[view["Transaction"] == "Expenditure"].groupby("Category")["Amount"].sum()
+        category_expenses = totals.category_totals("Expenditure")
         pie_col, line_col = st.columns(2)
+        # charts are built once per rollups version and then served from the chart cache;
+        # interactive charts are drawn (and zoomed/panned) in the browser
+        engine = st.radio("Charts", charts.ENGINES, index=charts.ENGINES.index(charts.default_engine()),
+                          format_func=str.capitalize, horizontal=True)
+        interactive = engine == "interactive"
+
+        def show_chart(col, static_chart, interactive_chart):
+            if interactive:
+                col.altair_chart(interactive_chart(totals), use_container_width=True)
+            else:
+                col.image(static_chart(totals))
+
         if not category_expenses.empty and category_expenses.sum() > 0:
-            fig1, ax1 = plt.subplots()
-            ax1.pie(category_expenses, labels=category_expenses.index, autopct='%1.1f%%', startangle=90)
-            ax1.axis("equal")
-            ax1.set_title("Category-wise Expenses")
-            pie_col.pyplot(fig1)
+            show_chart(pie_col, charts.category_pie, charts.interactive_category_pie)
         else:
             pie_col.warning("No expenditure data for category-wise chart.")
 
         # --- Monthly Expenses Line Chart ---
-        monthly_expenses = (
-            view[view["Transaction"] == "Expenditure"]
-            .groupby(view["Date"].dt.to_period("M"))["Amount"]
-            .sum()
-        )
+        monthly_expenses = totals.monthly_totals("Expenditure")
 
         if not monthly_expenses.empty and monthly_expenses.sum() > 0:
-            fig2, ax2 = plt.subplots()
-            monthly_expenses.index = monthly_expenses.index.astype(str)  # ✅ Fix: convert PeriodIndex to string
-            ax2.plot(monthly_expenses.index, monthly_expenses.values, marker="o")
-            ax2.set_title("Monthly Expenses")
-            ax2.set_xlabel("Month")
-            ax2.set_ylabel("Amount (₹)")
-            plt.xticks(rotation=45)
-            line_col.pyplot(fig2)
+            show_chart(line_col, charts.monthly_line, charts.interactive_monthly_line)
         else:
             line_col.warning("No expenditure data for monthly chart.")
 
         # --- Income vs Expenditure Over Time ---
-        daily = view.groupby(["Date", "Transaction"])["Amount"].sum().unstack(fill_value=0)
-        if not daily.empty:
-            fig3, ax3 = plt.subplots()
-            if "Income" in daily.columns and daily["Income"].sum() > 0:
-                ax3.plot(daily.index, daily["Income"], label="Income", color="green", marker="o")
-            if "Expenditure" in daily.columns and daily["Expenditure"].sum() > 0:
-                ax3.plot(daily.index, daily["Expenditure"], label="Expenditure", color="red", marker="o")
-            ax3.set_title("Income vs Expenditure Over Time")
-            ax3.set_xlabel("Date")
-            ax3.set_ylabel("Amount")
-            ax3.legend()
-            metric_col1.pyplot(fig3)
+        if totals.by_day:
+            show_chart(metric_col1, charts.income_vs_expenditure, charts.interactive_income_vs_expenditure)
         else:
             metric_col1.warning("No daily transaction data for income vs expenditure chart.")
 
         # --- Monthly Expenses Bar Chart ---
         if not monthly_expenses.empty and monthly_expenses.sum() > 0:
-            fig4, ax4 = plt.subplots()
-            ax4.bar(monthly_expenses.index.astype(str), monthly_expenses.values, color="red")  # ✅ Fix applied here
-            ax4.set_title("Monthly Expenses")
-            ax4.set_xlabel("Month")
-            ax4.set_ylabel("Total Expenses")
-            plt.xticks(rotation=45)
-            line_col.pyplot(fig4)
+            show_chart(line_col, charts.monthly_bar, charts.interactive_monthly_bar)
         else:
             line_col.warning("No expenditure data for monthly bar chart.")
 
         # --- Top 5 Biggest Expenses ---
-        top_expenses = view[view["Transaction"] == "Expenditure"].nlargest(5, "Amount")
+        top_expenses = totals.top_expenses()
         if not top_expenses.empty:
             st.subheader("Top 5 Biggest Expenses")
-            st.table(top_expenses[["Date","Category","Description","Amount"]])
+            st.table(top_expenses)
         else:
             st.warning("No expenditure data to display top expenses.")
 
 
-#Check if autopay needs to be paid today or if the due date has been exceeded  
-today=datetime.date.today()
-for idx, row in autopay.iterrows():
-    next_due_date = pd.to_datetime(row["Next Due"]).date()
-    if next_due_date<=today:
-        expenses, balance = add_expense(expenses, today.strftime("%Y-%m-%d"), row["Category"], row["Description"], row["Amount"], balance)
+# --- Performance (EXPENSE_TRACKER_TELEMETRY=on or memory) ---
+#Latency of the recorded spans (loads, saves, rollups, charts, whole reruns) in this server process
+def performance_page(data):
+    st.header("Performance")
+    spans = telemetry.recent()
+    if not spans:
+        st.info("Nothing recorded yet, open a few pages first.")
+        return
+    st.caption(f"Last {len(spans)} spans of this server process. A load.* span is a cache miss "
+               "(a file parsed or a ledger/rollups/index built), save.* a write, chart.* a chart rendered.")
+    st.dataframe(pd.DataFrame(telemetry.summary(spans)).round(2), use_container_width=True, hide_index=True)
+
+    st.subheader("Recent reruns")
+    reruns = [span for span in spans if span["name"] == "rerun"][-20:]
+    for rerun in reversed(reruns):
+        children = [span for span in spans if span["trace_id"] == rerun["trace_id"] and span is not rerun]
+        with st.expander(f"{rerun['attributes'].get('page')}: {rerun['duration_ms']:.1f} ms"):
+            if children:
+                table = pd.DataFrame(children).reindex(columns=["name", "duration_ms", "peak_mb", "attributes"])
+                st.dataframe(table.dropna(axis=1, how="all"), use_container_width=True, hide_index=True)
+            else:
+                st.write("Everything came from the caches.")
+    if telemetry.trace_file():
+        st.caption(f"Spans are also written to {telemetry.trace_file()}")
+    if st.button("Clear"):
+        telemetry.clear()
+        st.rerun()
 
-        if row["Frequency"] == "Daily":
-            next_due = next_due_date + pd.Timedelta(days=1)
-        elif row["Frequency"] == "Weekly":
-            next_due = next_due_date + pd.Timedelta(weeks=1)
-        elif row["Frequency"] == "Monthly":
-            next_due = next_due_date + pd.DateOffset(months=1)
-        elif row["Frequency"] == "Yearly":
-            next_due = next_due_date + pd.DateOffset(years=1)
-        
-        autopay.at[idx, "Next Due"] = next_due.strftime("%Y-%m-%d")
-    save_autopay(autopay)
 
+# --- Navigation ---
+# page name -> (page function, datasets it reads through PageData), only the open page
+# runs on a rerun
+PAGES = {
+    "Home": (home_page, ("balance", "rollups")),
+    "Add Transactions": (add_transactions_page, ()),
+    "View Transactions": (view_transactions_page, ("balance", "rollups", "positions")),
+    "Analytics and Report": (analytics_page, ("rollups",)),
+    "Loans and Debts": (loans_and_debts_page, ("positions",)),
+    "AutoPay": (autopay_page, ()),
+}
+if telemetry.enabled():
+    PAGES["Performance"] = (performance_page, ())
 
+if "page" not in st.session_state:
+    st.session_state.page = "Home"
+
+st.sidebar.header("Menu")
+for page_name in PAGES:
+    if st.sidebar.button(page_name): st.session_state.page = page_name
 
+page_function, needs = PAGES[st.session_state.page]
+with telemetry.span("rerun", page=st.session_state.page):
+    page_function(PageData(needs))
@@ -0,0 +1,21 @@
+import pytest
+
+from expense_tracker import storage
+
+KINDS = ("csv", "sqlite", "parquet", "arrow")
+
+
+#parquet and arrow need the optional pyarrow package and are skipped without it
+@pytest.fixture(params=KINDS)
+def kind(request):
+    if request.param in ("parquet", "arrow"):
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+#a fresh backend of every kind in its own folder
+@pytest.fixture
+def backend(kind, tmp_path):
+    opened = storage.open_backend(kind, str(tmp_path))
+    yield opened
+    opened.close()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+from expense_tracker import api
+
+
+#one request through the ASGI app, returns (status, decoded JSON body)
+def call(app, method, path, body=None, **query):
+    sent = {}
+    messages = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            sent["status"] = message["status"]
+        else:
+            sent["body"] = json.loads(message["body"])
+
+    scope = {"type": "http", "method": method, "path": path, "headers": [],
+             "query_string": urlencode(query).encode()}
+    asyncio.run(app(scope, receive, send))
+    return sent["status"], sent["body"]
+
+
+@pytest.fixture
+def app(backend):
+    backend.save_balance(1000)
+    served = api.API(backend)
+    yield served
+    served.close()
+
+
+def test_add_and_list_transactions(app):
+    status, body = call(app, "POST", "/transactions", [{"amount": 10, "category": "Food"}, {"amount": 5}])
+    assert (status, body["balance"]) == (200, 985)
+    status, page = call(app, "GET", "/transactions", limit=1)
+    assert status == 200 and [row["ID"] for row in page["rows"]] == [1]
+    status, page = call(app, "GET", "/transactions", limit=1, after=json.dumps(page["next"]))
+    assert status == 200 and [row["ID"] for row in page["rows"]] == [2]
+
+
+@pytest.mark.parametrize("body", [
+    {"amount": 1e400}, {"amount": "nan"}, {"amount": 0}, {"amount": True}, {"amount": "x"},
+    {"amount": 5, "category": 3}, {"amount": 5, "description": ["x"]},
+    {"amount": 5, "transaction": "Refund"}, {"amount": 5, "date": "2025-13-01"},
+    [{"amount": 2}, {"amount": 3, "description": {"a": 1}}], [],
+])
+def test_bad_transactions_are_rejected(app, body):
+    assert call(app, "POST", "/transactions", body)[0] == 400
+    assert call(app, "GET", "/report")[1]["balance"] == 1000
+
+
+@pytest.mark.parametrize("sort,cursor", [
+    ("ID", [1, 2, 3]), ("ID", [None, 2]), ("ID", ["a", 2]), ("ID", [1, True]), ("ID", [1, 2.5]),
+    ("ID", 5), ("Date", ["2025-13-01", 1]), ("Date", [5, 1]), ("Category", [5, 1]),
+])
+def test_bad_cursors_are_rejected(app, sort, cursor):
+    assert call(app, "GET", "/transactions", sort=sort, after=json.dumps(cursor))[0] == 400
+
+
+@pytest.mark.parametrize("ids", [[None], [[1]], [1.9], ["x"], [True], [], "1"])
+def test_bad_loan_ids_are_rejected(app, ids):
+    call(app, "POST", "/loans", {"kind": "Loan", "to": "Asha", "amount": 50})
+    assert call(app, "POST", "/loans/settle", {"ids": ids})[0] == 400
+    assert call(app, "POST", "/loans/settle", {"ids": [1]})[1] == {"paid": [1], "skipped": []}
+
+
+@pytest.mark.parametrize("body", [
+    {"kind": "Gift", "to": "Asha", "amount": 5}, {"kind": "Loan", "to": {"a": 1}, "amount": 5},
+    {"kind": "Loan", "to": " ", "amount": 5}, {"kind": "Loan", "to": "Asha", "amount": -5},
+])
+def test_bad_loans_are_rejected(app, body):
+    assert call(app, "POST", "/loans", body)[0] == 400
+
+
+def test_unknown_endpoint(app):
+    assert call(app, "GET", "/nowhere")[0] == 404
+    assert call(app, "DELETE", "/loans")[0] == 405
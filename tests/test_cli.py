@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from expense_tracker import cli
+
+
+def test_add_uses_the_configured_data_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("EXPENSE_TRACKER_DATA", str(tmp_path / "data"))
+    monkeypatch.setenv("EXPENSE_TRACKER_BACKEND", "sqlite")
+    (tmp_path / "data").mkdir()
+    cli.main(["add", "expense", "5"])
+    assert "expenses.db" in os.listdir(tmp_path / "data")
+    assert not (tmp_path / "expenses.db").exists()
+    cli.main(["--db", str(tmp_path / "other.db"), "add", "expense", "5"])
+    assert (tmp_path / "other.db").exists()
+
+
+@pytest.mark.parametrize("amount", ["0", "-5", "nan", "inf", "1e400", "abc"])
+def test_bad_amounts_are_usage_errors(amount):
+    with pytest.raises(SystemExit) as exit:
+        cli.main(["add", "expense", "--", amount])
+    assert exit.value.code == 2
@@ -0,0 +1,71 @@
+import datetime
+import os
+
+import pytest
+
+from expense_tracker import storage
+
+class Crash(Exception):
+    pass
+
+
+def with_loan(backend):
+    backend.save_balance(1000)
+    backend.post([(datetime.date(2025, 1, 1), "Expenditure", "Food", "lunch", 10)])
+    backend.register_loan(datetime.date(2025, 1, 2), "Loan", "Asha", "Loan given to Asha", 100)
+
+
+#Settle the loan, but let the commit stop after the journal is written: with `applied`
+#the expenses append already happened, otherwise nothing did
+def crash_while_settling(backend, applied):
+    apply = backend._apply
+
+    def crashing(record):
+        if applied:
+            backend._append_expenses(record["append"])
+        raise Crash()
+
+    backend._apply = crashing
+    with pytest.raises(Crash):
+        backend.settle_loans([1])
+    backend._apply = apply
+
+
+@pytest.mark.parametrize("applied", [False, True])
+def test_journal_is_replayed_once(tmp_path, kind, applied):
+    if kind == "sqlite":
+        pytest.skip("SQLite commits in a native transaction, there is no journal")
+    backend = storage.open_backend(kind, str(tmp_path))
+    with_loan(backend)
+    crash_while_settling(backend, applied)
+    backend.close()
+    assert os.path.exists(backend._journal_path())
+
+    #the next writer (here another instance, as after a restart) finishes the commit
+    reopened = storage.open_backend(kind, str(tmp_path))
+    with reopened.write_lock():
+        pass
+    assert not os.path.exists(reopened._journal_path())
+    expenses = reopened.load_expenses()
+    assert list(expenses["Description"]) == ["lunch", "Loan paid by Asha"]
+    assert list(expenses["ID"]) == [1, 2]
+    assert reopened.load_loans()["Status"].tolist() == ["Settled"]
+    assert reopened.load_balance() == 1090
+    assert reopened.ledger().last_id == 2
+    reopened.close()
+
+
+def test_failed_transaction_writes_nothing(tmp_path, kind):
+    backend = storage.open_backend(kind, str(tmp_path))
+    with_loan(backend)
+    with pytest.raises(Crash):
+        with backend.transaction():
+            backend.post([(datetime.date(2025, 1, 3), "Expenditure", "Food", "dinner", 20)])
+            raise Crash()
+    assert len(backend.load_expenses()) == 1
+    assert backend.load_balance() == 990
+    reopened = storage.open_backend(kind, str(tmp_path))
+    assert len(reopened.load_expenses()) == 1
+    assert reopened.load_balance() == 990
+    backend.close()
+    reopened.close()
@@ -0,0 +1,109 @@
+import datetime
+
+import pandas as pd
+
+from expense_tracker import storage
+
+
+def autopay_row(description, amount=100.0, start="2025-01-01"):
+    return pd.DataFrame([[None, start, "Expenditure", "AutoPay", description, amount, "Monthly", start]],
+                        columns=storage.AUTOPAY_COLUMNS)
+
+
+def test_added_transactions_are_reloaded(backend, kind, tmp_path):
+    backend.save_balance(1000)
+    backend.post([(datetime.date(2025, 1, 1), "Expenditure", "Food", "lunch", 12.5)])
+    backend.post([(datetime.date(2025, 1, 2), "Income", "Salary", "pay", 500),
+                  (datetime.date(2025, 1, 3), "Expenditure", "Rent", "rent", 300)])
+    assert backend.load_balance() == 1187.5
+
+    #read back by another instance, as after a restart
+    reopened = storage.open_backend(kind, str(tmp_path))
+    expenses = reopened.load_expenses()
+    assert list(expenses["ID"]) == [1, 2, 3]
+    assert list(expenses["Bank Balance"]) == [987.5, 1487.5, 1187.5]
+    assert list(expenses["Category"]) == ["Food", "Salary", "Rent"]
+    assert reopened.load_balance() == 1187.5
+    assert reopened.balance_as_of(datetime.date(2025, 1, 1)) == 987.5
+    assert reopened.rollups().total("Expenditure") == 312.5
+    reopened.close()
+
+
+def test_saved_tables_are_reloaded(backend, kind, tmp_path):
+    backend.save_balance(250)
+    backend.register_loan(datetime.date(2025, 1, 1), "Loan", "Asha", "Loan given to Asha", 40)
+    backend.register_loan(datetime.date(2025, 1, 2), "Debt", "Ravi", "Indebted to Ravi", 60)
+    backend.settle_loans([2], [20])
+    backend.save_autopay(autopay_row("Rent"))
+
+    #read back by another instance, as after a restart
+    reopened = storage.open_backend(kind, str(tmp_path))
+    assert reopened.opening_balance() == 250
+    loans = reopened.load_loans()
+    assert list(loans["ID"]) == [1, 2]
+    assert list(loans["Status"]) == ["Unpaid", "Partially Paid"]
+    assert list(loans["Paid"]) == [0, 20]
+    assert reopened.load_balance() == 230
+    assert list(reopened.load_autopay()["Description"]) == ["Rent"]
+    assert reopened.positions().total_owed_by_me() == 40
+    reopened.close()
+
+
+def test_pages_cover_every_row(backend):
+    backend.save_balance(0)
+    backend.post([(datetime.date(2025, 1, 1 + i % 28), "Income", "Salary", str(i), i + 1) for i in range(25)])
+    seen, cursor = [], None
+    while True:
+        page = backend.page("expenses", "Date", True, after=cursor, limit=7)
+        seen.extend(page.rows["ID"])
+        if page.next is None:
+            break
+        cursor = page.next
+    assert sorted(seen) == list(range(1, 26))
+    dates = backend.query_expenses().set_index("ID").loc[seen, "Date"]
+    assert list(dates) == sorted(dates, reverse=True)
+
+
+#what the AutoPay page does: a checked-out frame plus a new row without an ID
+def test_new_autopay_rows_get_ids(backend):
+    backend.save_autopay(autopay_row("Rent"))
+    backend.drop_caches()
+    autopay, version = backend.checkout("autopay")
+    saved = backend.save_autopay(pd.concat([autopay, autopay_row("Internet")], ignore_index=True),
+                                 (autopay.copy(), version))
+    assert list(saved["ID"]) == [1, 2]
+    assert list(backend.load_autopay()["Description"]) == ["Rent", "Internet"]
+
+
+def test_with_ids_fills_nullable_ids():
+    df = autopay_row("Rent")
+    df["ID"] = pd.array([pd.NA], dtype="Int64")
+    df = pd.concat([autopay_row("Water").assign(ID=pd.array([4], dtype="Int64")), df], ignore_index=True)
+    assert list(storage.with_ids(df, storage.AUTOPAY_COLUMNS)["ID"]) == [4, 5]
+
+
+#two tabs check out the same autopay table, the second save merges with the first
+def test_concurrent_autopay_saves_are_merged(backend):
+    backend.save_autopay(pd.concat([autopay_row("Rent"), autopay_row("Water")], ignore_index=True))
+    first = backend.checkout("autopay")
+    second = backend.checkout("autopay")
+
+    added = pd.concat([first[0], autopay_row("Internet")], ignore_index=True)
+    backend.save_autopay(added, (first[0].copy(), first[1]))
+
+    edited = second[0].copy()
+    edited.loc[edited["Description"] == "Rent", "Frequency"] = "Yearly"
+    edited = edited[edited["Description"] != "Water"]
+    backend.save_autopay(edited, (second[0].copy(), second[1]))
+
+    saved = backend.load_autopay().set_index("Description")
+    assert sorted(saved.index) == ["Internet", "Rent"]
+    assert saved.loc["Rent", "Frequency"] == "Yearly"
+    assert saved["ID"].is_unique
+
+
+def test_save_without_a_concurrent_change_overwrites(backend):
+    backend.save_autopay(autopay_row("Rent"))
+    autopay, version = backend.checkout("autopay")
+    backend.save_autopay(autopay.iloc[0:0], (autopay.copy(), version))
+    assert backend.load_autopay().empty
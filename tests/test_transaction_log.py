@@ -0,0 +1,95 @@
+import csv
+import os
+
+from expense_tracker import transaction_log
+
+COLUMNS = ["ID", "Amount"]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [[int(i), float(a)] for i, a in list(csv.reader(f))[1:]]
+
+
+def test_appended_rows_are_pending_until_compaction(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [[1, 10.0]])
+    transaction_log.append_many(path, [[2, 20.0]], COLUMNS)
+    transaction_log.append_many(path, [[3, 30.0], [4, 40.0]], COLUMNS)
+    assert transaction_log.pending_rows(path) == [[2, 20.0], [3, 30.0], [4, 40.0]]
+    assert read_csv(path) == [[1, 10.0]]
+
+    transaction_log.compact(path)
+    assert transaction_log.pending_rows(path) == []
+    assert not os.path.exists(transaction_log.log_path(path))
+    assert read_csv(path) == [[1, 10.0], [2, 20.0], [3, 30.0], [4, 40.0]]
+
+
+#a record cut short by a crash fails the length/crc check and is dropped
+def test_torn_record_is_dropped(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [[1, 10.0]])
+    transaction_log.append_many(path, [[2, 20.0]], COLUMNS)
+    transaction_log.append_many(path, [[3, 30.0]], COLUMNS)
+    log = transaction_log.log_path(path)
+    with open(log, "r+b") as f:
+        f.truncate(os.path.getsize(log) - 3)
+    assert transaction_log.pending_rows(path) == [[2, 20.0]]
+
+    transaction_log._repaired.discard(log)
+    transaction_log.append_many(path, [[3, 31.0]], COLUMNS)
+    assert transaction_log.pending_rows(path) == [[2, 20.0], [3, 31.0]]
+
+
+def test_corrupted_record_is_dropped(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [])
+    transaction_log.append_many(path, [[1, 10.0]], COLUMNS)
+    log = transaction_log.log_path(path)
+    with open(log, "r+b") as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b"!!")
+    assert transaction_log.pending_rows(path) == []
+
+
+#a compaction that crashed after appending part of the rows to the CSV is redone
+#without duplicating them
+def test_crashed_compaction_is_redone(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [[1, 10.0]])
+    transaction_log.append_many(path, [[2, 20.0], [3, 30.0]], COLUMNS)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([2, 20.0])
+    assert transaction_log.pending_rows(path) == []
+    assert read_csv(path) == [[1, 10.0], [2, 20.0], [3, 30.0]]
+    assert not os.path.exists(transaction_log.log_path(path))
+
+
+#after a full rewrite the log's rows are part of the new file
+def test_rewrite_supersedes_the_log(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [[1, 10.0]])
+    transaction_log.append_many(path, [[2, 20.0]], COLUMNS)
+    transaction_log.rewrite(path, lambda tmp: write_csv(tmp, [[1, 10.0], [2, 25.0]]))
+    assert transaction_log.pending_rows(path) == []
+    assert read_csv(path) == [[1, 10.0], [2, 25.0]]
+
+
+def test_compaction_hooks_run_around_it(tmp_path):
+    path = str(tmp_path / "expenses.csv")
+    write_csv(path, [])
+    transaction_log.append_many(path, [[1, 10.0]], COLUMNS)
+    stages = []
+    transaction_log.on_compaction(path, stages.append)
+    transaction_log.compact(path)
+    transaction_log.remove_compaction_hook(path, stages.append)
+    transaction_log.compact(path)
+    assert stages == ["before", "after"]
+    assert path not in transaction_log._compaction_hooks